@@ -0,0 +1,108 @@
+"""Precomputed attack tables
+
+Leaper attacks (knight, king, pawn) are looked up directly by square.
+Sliding attacks use per-direction rays: the ray is cut at the first
+blocker found in the occupancy mask.
+"""
+
+__all__ = [
+    "KNIGHT_ATTACKS",
+    "KING_ATTACKS",
+    "PAWN_ATTACKS",
+    "RAYS",
+    "rook_attacks",
+    "bishop_attacks",
+    "queen_attacks",
+]
+
+from .utils import correct_coords
+
+# (row, col) steps; rays with positive square delta come first
+ROOK_DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+def _leaper_table(steps: tuple[tuple[int, int], ...]) -> list[int]:
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        for d_row, d_col in steps:
+            if correct_coords(row + d_row, col + d_col):
+                mask |= 1 << ((row + d_row) * 8 + col + d_col)
+        table.append(mask)
+    return table
+
+
+def _ray_table(d_row: int, d_col: int) -> list[int]:
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        row, col = row + d_row, col + d_col
+        while correct_coords(row, col):
+            mask |= 1 << (row * 8 + col)
+            row, col = row + d_row, col + d_col
+        table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_table(
+    ((1, 2), (2, 1), (-1, 2), (-2, 1), (1, -2), (2, -1), (-1, -2), (-2, -1))
+)
+KING_ATTACKS = _leaper_table(
+    ((1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+)
+# White pawns move towards row 0, black ones towards row 7
+PAWN_ATTACKS = (
+    _leaper_table(((-1, -1), (-1, 1))),
+    _leaper_table(((1, -1), (1, 1))),
+)
+
+RAYS = {direction: _ray_table(*direction) for direction in ROOK_DIRECTIONS}
+RAYS.update({direction: _ray_table(*direction) for direction in BISHOP_DIRECTIONS})
+
+# Rays ordered as (positive, negative) pairs for the slider functions
+_ROOK_RAYS = (
+    (RAYS[(1, 0)], RAYS[(0, 1)]),
+    (RAYS[(-1, 0)], RAYS[(0, -1)]),
+)
+_BISHOP_RAYS = (
+    (RAYS[(1, 1)], RAYS[(1, -1)]),
+    (RAYS[(-1, 1)], RAYS[(-1, -1)]),
+)
+
+
+def _slide(sq: int, occupied: int, rays: tuple[tuple[list[int], ...], ...]) -> int:
+    attacks = 0
+    positive, negative = rays
+    for ray in positive:
+        mask = ray[sq]
+        blockers = mask & occupied
+        if blockers:
+            first = (blockers & -blockers).bit_length() - 1
+            mask ^= ray[first]
+        attacks |= mask
+    for ray in negative:
+        mask = ray[sq]
+        blockers = mask & occupied
+        if blockers:
+            first = blockers.bit_length() - 1
+            mask ^= ray[first]
+        attacks |= mask
+    return attacks
+
+
+def rook_attacks(sq: int, occupied: int) -> int:
+    """Returns squares attacked by a rook on `sq`, blockers included"""
+    return _slide(sq, occupied, _ROOK_RAYS)
+
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+    """Returns squares attacked by a bishop on `sq`, blockers included"""
+    return _slide(sq, occupied, _BISHOP_RAYS)
+
+
+def queen_attacks(sq: int, occupied: int) -> int:
+    """Returns squares attacked by a queen on `sq`, blockers included"""
+    return _slide(sq, occupied, _ROOK_RAYS) | _slide(sq, occupied, _BISHOP_RAYS)
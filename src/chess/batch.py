@@ -0,0 +1,232 @@
+"""Batch analysis of FEN/EPD position files
+
+Positions are streamed from the input file, analysed in worker processes
+and written to JSONL or CSV in input order as soon as they are ready.
+Only a fixed window of positions is in flight, so memory does not depend
+on input size. With `--resume` positions already in the output are skipped.
+
+Usage: python -m chess.batch INPUT OUTPUT [-d DEPTH | -t MOVETIME] [--perft]
+"""
+
+__all__ = ["read_positions", "analyse", "run_batch"]
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, TextIO
+
+from .board import Board
+from .engine import DEFAULT_TT_MB, search
+from .perft import perft
+from .transposition import TranspositionTable
+
+CSV_FIELDS = (
+    "index",
+    "id",
+    "fen",
+    "move",
+    "score",
+    "depth",
+    "nodes",
+    "time",
+    "pv",
+    "error",
+)
+
+# Positions in flight per worker
+WINDOW_PER_WORKER = 4
+PROGRESS_INTERVAL = 1.0
+
+_worker_tt: TranspositionTable | None = None
+
+
+def read_positions(lines: Iterator[str]) -> Iterator[tuple[str, str | None]]:
+    """Yields (fen, id) from FEN or EPD lines, skipping blanks and `#` comments.
+    EPD operations other than `id` are ignored"""
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split(None, 4)
+        fen = " ".join(fields[:4])
+        rest = fields[4] if len(fields) > 4 else ""
+        # Move clocks of a full FEN, EPD has operations in their place
+        for _ in range(2):
+            clock, *tail = rest.split(None, 1) or [""]
+            if not clock.isdigit():
+                break
+            fen += " " + clock
+            rest = tail[0] if tail else ""
+        position_id = None
+        for operation in rest.split(";"):
+            opcode, _, operand = operation.strip().partition(" ")
+            if opcode == "id":
+                position_id = operand.strip().strip('"')
+        yield fen, position_id
+
+
+def _init_worker(tt_mb: float) -> None:
+    global _worker_tt
+    _worker_tt = TranspositionTable(tt_mb)
+
+
+def analyse(
+    index: int,
+    fen: str,
+    position_id: str | None,
+    depth: int | None,
+    movetime: float | None,
+    run_perft: bool = False,
+) -> dict:
+    """Analyse one position, errors are reported in the `error` field"""
+    result = {"index": index, "id": position_id, "fen": fen}
+    try:
+        board = Board.from_fen(fen)
+    except ValueError as e:
+        result["error"] = str(e)
+        return result
+
+    start = time.perf_counter()
+    if run_perft:
+        result["depth"] = depth
+        result["nodes"] = perft(board, depth or 1)
+        result["time"] = round(time.perf_counter() - start, 4)
+        return result
+
+    tt = _worker_tt if _worker_tt is not None else TranspositionTable(DEFAULT_TT_MB)
+    found = search(board, depth, movetime, tt)
+    result.update(
+        move=found.move.uci() if found.move else None,
+        score=found.score,
+        depth=found.depth,
+        nodes=found.nodes,
+        time=round(found.time, 4),
+        pv=" ".join(move.uci() for move in found.pv),
+    )
+    return result
+
+
+def _done_count(path: str, is_csv: bool) -> int:
+    """Returns number of complete records in output, dropping a torn last line"""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+        lines = data[:end].count(b"\n")
+    return max(lines - 1, 0) if is_csv else lines
+
+
+def run_batch(
+    input_path: str,
+    output_path: str,
+    depth: int | None = None,
+    movetime: float | None = None,
+    run_perft: bool = False,
+    workers: int | None = None,
+    tt_mb: float = DEFAULT_TT_MB,
+    resume: bool = False,
+    progress: TextIO | None = sys.stderr,
+) -> int:
+    """Analyse every position of input file, returns number of positions written"""
+    workers = workers or os.cpu_count() or 1
+    is_csv = output_path.endswith(".csv")
+    skip = _done_count(output_path, is_csv) if resume else 0
+
+    with (
+        open(input_path, encoding="utf-8") as source,
+        open(output_path, "a" if skip else "w", newline="", encoding="utf-8") as out,
+        ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(tt_mb,)
+        ) as pool,
+    ):
+        if is_csv:
+            writer = csv.DictWriter(out, CSV_FIELDS, extrasaction="ignore")
+            if not skip:
+                writer.writeheader()
+
+        def write(record: dict) -> None:
+            if is_csv:
+                writer.writerow(record)
+            else:
+                out.write(json.dumps(record) + "\n")
+            out.flush()
+
+        start = last_report = time.perf_counter()
+        written = 0
+        pending = deque()
+        positions = enumerate(read_positions(source))
+        for index, (fen, position_id) in positions:
+            if index < skip:
+                continue
+            pending.append(
+                pool.submit(
+                    analyse, index, fen, position_id, depth, movetime, run_perft
+                )
+            )
+            # Keep a bounded window, always writing the oldest position first
+            while len(pending) >= workers * WINDOW_PER_WORKER or (
+                pending and pending[0].done()
+            ):
+                write(pending.popleft().result())
+                written += 1
+
+            now = time.perf_counter()
+            if progress is not None and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                rate = written / (now - start)
+                print(f"{skip + written} positions, {rate:.1f}/s", file=progress)
+
+        while pending:
+            write(pending.popleft().result())
+            written += 1
+
+    if progress is not None:
+        elapsed = time.perf_counter() - start
+        print(
+            f"done: {written} positions in {elapsed:.1f}s"
+            + (f", skipped {skip} already in output" if skip else ""),
+            file=progress,
+        )
+    return written
+
+
+def main(argv: list[str] | None = None) -> int:
+    """main"""
+    parser = argparse.ArgumentParser(
+        prog="python -m chess.batch", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("input", help="FEN or EPD file, one position per line")
+    parser.add_argument("output", help="`.jsonl` or `.csv` result file")
+    parser.add_argument("-d", "--depth", type=int)
+    parser.add_argument("-t", "--movetime", type=float, help="seconds per position")
+    parser.add_argument("--perft", action="store_true", help="count perft nodes")
+    parser.add_argument("-w", "--workers", type=int)
+    parser.add_argument("--hash", type=float, default=DEFAULT_TT_MB, help="MB")
+    parser.add_argument("--resume", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.perft and not args.depth:
+        parser.error("--perft needs --depth")
+    run_batch(
+        args.input,
+        args.output,
+        args.depth,
+        args.movetime,
+        args.perft,
+        args.workers,
+        args.hash,
+        args.resume,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
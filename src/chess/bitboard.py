@@ -0,0 +1,66 @@
+"""Bitboard helpers
+
+Squares are numbered `row * 8 + col`, so square 0 is the top-left cell
+(`a8`) and square 63 is the bottom-right one (`h1`), matching `Board.field`.
+"""
+
+__all__ = [
+    "PIECE_CHARS",
+    "PAWN",
+    "KNIGHT",
+    "BISHOP",
+    "ROOK",
+    "QUEEN",
+    "KING",
+    "square",
+    "row_col",
+    "bit",
+    "iter_squares",
+    "lsb",
+    "SQUARE_NAMES",
+    "parse_square",
+]
+
+from typing import Iterator
+
+# Piece type indexes; bitboard of a piece is `bitboards[color_index * 6 + type]`
+PIECE_CHARS = "PNBRQK"
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+# Algebraic names, `a8` is square 0
+SQUARE_NAMES = [f"{file}{8 - row}" for row in range(8) for file in "abcdefgh"]
+
+
+def square(row: int, col: int) -> int:
+    """Returns square index of cell (row, col)"""
+    return row * 8 + col
+
+
+def row_col(sq: int) -> tuple[int, int]:
+    """Returns (row, col) of square index"""
+    return sq >> 3, sq & 7
+
+
+def bit(row: int, col: int) -> int:
+    """Returns bitboard with only cell (row, col) set"""
+    return 1 << (row * 8 + col)
+
+
+def lsb(bb: int) -> int:
+    """Returns index of the least significant set bit"""
+    return (bb & -bb).bit_length() - 1
+
+
+def iter_squares(bb: int) -> Iterator[int]:
+    """Yields indexes of all set bits, lowest first"""
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def parse_square(name: str) -> int:
+    """Returns square index of algebraic name like `e4`"""
+    if len(name) != 2 or name[0] not in "abcdefgh" or name[1] not in "12345678":
+        raise ValueError(f"Invalid square name: {name!r}")
+    return (8 - int(name[1])) * 8 + "abcdefgh".index(name[0])
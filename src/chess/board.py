@@ -1,10 +1,23 @@
-__name__ = "Chess board module"
-__all__ = ["Board"]
+"""Chess board module"""
+
+__all__ = ["Board", "START_FEN"]
+
+from typing import TYPE_CHECKING
+import struct
 
-from copy import deepcopy
-from itertools import product
 from .utils import *
 from .pieces import *
+from .bitboard import *
+from .attacks import *
+from .move import *
+from . import movegen
+from . import zobrist
+from .zobrist import PIECE_KEYS, CASTLING_KEYS, SIDE_KEY, ep_key
+from . import evaluation
+from .evaluation import MG_TABLES, EG_TABLES, PHASE_WEIGHTS
+
+if TYPE_CHECKING:
+    from .tablebase import Tablebase
 
 
 START_FIELD = """
@@ -20,20 +33,216 @@ wR,wN,wB,wQ,wK,wB,wN,wR
     "\n", ""
 )
 
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Bitboard type index of every piece class
+PIECE_KINDS = {
+    Pawn: PAWN,
+    Knight: KNIGHT,
+    Bishop: BISHOP,
+    Rook: ROOK,
+    Queen: QUEEN,
+    King: KING,
+}
+
+# Piece class of every bitboard type index
+PIECE_CLASSES = (Pawn, Knight, Bishop, Rook, Queen, King)
+
+# Shared piece of every bitboard index, and the bitboard index of every piece
+PIECES = [
+    piece_class(color)
+    for color in (Color.WHITE, Color.BLACK)
+    for piece_class in PIECE_CLASSES
+]
+PIECE_INDICES = {piece: index for index, piece in enumerate(PIECES)}
+
+PROMOTION_PIECES = {"Q": Queen, "R": Rook, "B": Bishop, "N": Knight}
+
+# Castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+FEN_PIECES = {
+    char: (piece_class, color)
+    for piece_char, piece_class in zip(PIECE_CHARS, PIECE_CLASSES)
+    for char, color in (
+        (piece_char, Color.WHITE),
+        (piece_char.lower(), Color.BLACK),
+    )
+}
+FEN_CASTLING = {
+    "K": WHITE_KINGSIDE,
+    "Q": WHITE_QUEENSIDE,
+    "k": BLACK_KINGSIDE,
+    "q": BLACK_QUEENSIDE,
+}
+
+# Piece class and color by two-symbol code of `field_as_text`, like `wQ`
+FIELD_PIECES = {
+    ("w" if char.isupper() else "b") + char.upper(): piece
+    for char, piece in FEN_PIECES.items()
+}
+
+# Rights kept after a piece leaves or arrives at a square:
+# moving a king or a rook, or capturing a rook at its corner, drops the right
+CASTLING_MASKS = [15] * 64
+CASTLING_MASKS[square(7, 4)] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[square(7, 7)] = 15 & ~WHITE_KINGSIDE
+CASTLING_MASKS[square(7, 0)] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASKS[square(0, 4)] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[square(0, 7)] = 15 & ~BLACK_KINGSIDE
+CASTLING_MASKS[square(0, 0)] = 15 & ~BLACK_QUEENSIDE
+
+# `to_bytes` header: occupancy, state bits, half-move clock, move number.
+# State: bit 0 black to move, bits 1-4 castling, bits 5-11 en passant
+# square + 1, bits 12-13 and 14-15 `Color.value` of check and mate.
+# Clocks are clamped to 16 bits, far beyond any game under the 75-move rule
+PACKED_HEADER = struct.Struct("<QHHH")
+MAX_PACKED_CLOCK = 0xFFFF
+
+# Changed squares kept for an update of `Board.square_attacks`, beyond that
+# (as in a search, which never asks for attack maps) it is rebuilt instead
+MAX_CHANGED_SQUARES = 32
+
 
 class Board:
     """Main chess board class"""
 
-    def __init__(self):
+    def __init__(self, fen: str = START_FEN, tablebase: "Tablebase | None" = None):
+        # Endgame tables probed by `endgame_check`, see `chess.tablebase`
+        self.tablebase = tablebase
         self.check: Color | None = None
         self.mate: Color | None = None
+        # (result, plies to mate) of the side to move from `tablebase`
+        self.endgame: tuple[int, int] | None = None
         self.color = Color.WHITE
-        self.field: list[list[Piece | None]] = []
 
-        # Fill the field with blank cells 8x8
-        self.field.extend([[None] * 8 for _ in range(8)])
-
-        self.field_from_text(START_FIELD)
+        # Position is kept as one 64-bit int per piece type and color
+        # (index `color.index * 6 + kind`) plus per-color occupancy masks.
+        # `squares` maps square index to piece for O(1) `get_piece`.
+        self.bitboards: list[int] = [0] * 12
+        self.occupancy: list[int] = [0, 0]
+        self.squares: list[Piece | None] = [None] * 64
+        # Squares attacked by each color, made from `square_attacks` on demand
+        self.attack_maps: list[int | None] = [None, None]
+        # Attacks of the piece on every square, None until first needed.
+        # Updated for the squares changed since, see `attacked_squares`
+        self.square_attacks: list[int] | None = None
+        self.changed_squares: list[int] | None = []
+        # Bit mask of castling rights
+        self.castling = 0
+        # Cell skipped by the last double pawn push, target of en passant
+        self.ep: int | None = None
+        # Zobrist key of the position, updated on every change
+        self.key = 0
+        # Material and piece-square sums and game phase, see `chess.evaluation`
+        self.mg = self.eg = self.phase = 0
+        # Half-moves since the last capture or pawn move, and move number
+        self.halfmove = 0
+        self.fullmove = 1
+        # Undo records of moves made with `make_move`
+        self.history: list[tuple] = []
+        # Keys of reversible positions before the history, see `set_repetition_keys`
+        self.prior_keys: list[int] = []
+
+        self.set_fen(fen)
+
+    def copy(self) -> "Board":
+        """Returns independent copy of the board with its move history.
+        Pieces are shared, so only lists of references are copied"""
+        board = object.__new__(type(self))
+        board.__dict__.update(self.__dict__)
+        board.bitboards = self.bitboards[:]
+        board.occupancy = self.occupancy[:]
+        board.squares = self.squares[:]
+        board.attack_maps = self.attack_maps[:]
+        if self.square_attacks is not None:
+            board.square_attacks = self.square_attacks[:]
+        if self.changed_squares is not None:
+            board.changed_squares = self.changed_squares[:]
+        board.history = self.history[:]
+        return board
+
+    def __reduce__(self) -> tuple:
+        """Pickle the position only, as `to_bytes`.
+        Move history is not kept, so the copy cannot `unmake_move`"""
+        return type(self).from_bytes, (self.to_bytes(),)
+
+    @property
+    def field(self) -> list[list[Piece | None]]:
+        """Returns 8x8 snapshot of pieces, kept for compatibility"""
+        return [self.squares[row * 8 : row * 8 + 8] for row in range(8)]
+
+    def occupied(self) -> int:
+        """Returns bitboard of all occupied cells"""
+        return self.occupancy[0] | self.occupancy[1]
+
+    def pieces_bb(self, color: Color, kind: int) -> int:
+        """Returns bitboard of pieces of given color and type"""
+        return self.bitboards[color.index * 6 + kind]
+
+    def _put(self, sq: int, piece: Piece) -> None:
+        """Place piece on empty square"""
+        mask = 1 << sq
+        color_index = piece.color.index
+        index = PIECE_INDICES[piece]
+        self.bitboards[index] |= mask
+        self.occupancy[color_index] |= mask
+        self.squares[sq] = piece
+        self.key ^= PIECE_KEYS[index][sq]
+        self.mg += MG_TABLES[index][sq]
+        self.eg += EG_TABLES[index][sq]
+        self.phase += PHASE_WEIGHTS[index % 6]
+        self._changed(sq)
+
+    def _remove(self, sq: int) -> Piece | None:
+        """Remove piece from square and return it"""
+        piece = self.squares[sq]
+        if piece is None:
+            return None
+        mask = ~(1 << sq)
+        color_index = piece.color.index
+        index = PIECE_INDICES[piece]
+        self.bitboards[index] &= mask
+        self.occupancy[color_index] &= mask
+        self.squares[sq] = None
+        self.key ^= PIECE_KEYS[index][sq]
+        self.mg -= MG_TABLES[index][sq]
+        self.eg -= EG_TABLES[index][sq]
+        self.phase -= PHASE_WEIGHTS[index % 6]
+        self._changed(sq)
+        return piece
+
+    def _move(self, sq: int, sq1: int) -> Piece | None:
+        """Move piece from `sq` to `sq1`, returns captured piece"""
+        captured = self._remove(sq1)
+        piece = self._remove(sq)
+        if piece is not None:
+            self._put(sq1, piece)
+        return captured
+
+    def _changed(self, sq: int) -> None:
+        """Drop attack maps after the piece on `sq` changed"""
+        attack_maps = self.attack_maps
+        attack_maps[0] = attack_maps[1] = None
+        changed = self.changed_squares
+        if changed is not None:
+            if len(changed) < MAX_CHANGED_SQUARES:
+                changed.append(sq)
+            else:
+                self.changed_squares = None
+
+    def _clear(self) -> None:
+        self.bitboards = [0] * 12
+        self.occupancy = [0, 0]
+        self.squares = [None] * 64
+        self.attack_maps = [None, None]
+        self.square_attacks = None
+        self.changed_squares = []
+        self.key = 0
+        self.mg = self.eg = self.phase = 0
 
     def field_as_text(self) -> str:
         return ";".join(
@@ -41,25 +250,219 @@ class Board:
         )
 
     def field_from_text(self, text: str) -> None:
-        rows = text.split(";")
-        for y, row in enumerate(rows):
-            pieces = row.split(",")
-            for x, piece_code in enumerate(pieces):
-                if piece_code == "_":
-                    self.field[y][x] = None
-                else:
-                    # `w`, `Q` = `wQ`
-                    color_char, piece_char = piece_code
-                    color = Color.from_char(color_char)
-                    piece_class = {
-                        "P": Pawn,
-                        "K": King,
-                        "Q": Queen,
-                        "B": Bishop,
-                        "N": Knight,
-                        "R": Rook,
-                    }[piece_char]
-                    self.field[y][x] = piece_class(color)
+        """Load pieces from `field_as_text` format. Turn is kept and
+        castling rights are granted for kings and rooks on their home cells"""
+        self._clear()
+        squares = self.squares
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        for sq, piece_code in enumerate(text.replace(";", ",").split(",")):
+            if piece_code != "_":
+                piece_class, color = FIELD_PIECES[piece_code]
+                index = color.index * 6 + PIECE_KINDS[piece_class]
+                squares[sq] = PIECES[index]
+                bitboards[index] |= 1 << sq
+                occupancy[color.index] |= 1 << sq
+        self.castling = self._castling_from_field()
+        self.ep = None
+        self.halfmove = 0
+        self.fullmove = 1
+        self.history = []
+        self.prior_keys = []
+        self.mate = None
+        self.key = zobrist.hash_board(self)
+        self.mg, self.eg, self.phase = evaluation.totals(self)
+        self.check_check()
+
+    @classmethod
+    def from_fen(cls, fen: str, tablebase: "Tablebase | None" = None) -> "Board":
+        """Returns board set up from FEN string"""
+        return cls(fen, tablebase)
+
+    def set_fen(self, fen: str) -> None:
+        """Load position from FEN string, move clocks are optional.
+        Raises ValueError if the string is malformed"""
+        fields = fen.split()
+        if not 4 <= len(fields) <= 6:
+            raise ValueError(f"Invalid FEN: {fen!r}")
+        placement, active, castling, ep = fields[:4]
+
+        # Single pass filling the bitboards directly, hashed once at the end
+        self._clear()
+        squares = self.squares
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        sq = 0
+        for char in placement:
+            if char == "/":
+                if sq & 7:
+                    raise ValueError(f"Invalid FEN placement: {placement!r}")
+                continue
+            if char in "12345678":
+                sq += ord(char) - 48
+                continue
+            if char not in FEN_PIECES or sq >= 64:
+                raise ValueError(f"Invalid FEN placement: {placement!r}")
+            piece_class, color = FEN_PIECES[char]
+            index = color.index * 6 + PIECE_KINDS[piece_class]
+            squares[sq] = PIECES[index]
+            bitboards[index] |= 1 << sq
+            occupancy[color.index] |= 1 << sq
+            sq += 1
+        if sq != 64 or placement.count("/") != 7:
+            raise ValueError(f"Invalid FEN placement: {placement!r}")
+
+        if active not in ("w", "b"):
+            raise ValueError(f"Invalid FEN active color: {active!r}")
+        self.color = Color.from_char(active)
+
+        self.castling = 0
+        if castling != "-":
+            for char in castling:
+                if char not in FEN_CASTLING:
+                    raise ValueError(f"Invalid FEN castling: {castling!r}")
+                self.castling |= FEN_CASTLING[char]
+        # Rights without king and rook on their home cells are dropped
+        self.castling &= self._castling_from_field()
+
+        self.ep = None if ep == "-" else parse_square(ep)
+        try:
+            self.halfmove = int(fields[4]) if len(fields) > 4 else 0
+            self.fullmove = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Invalid FEN move clocks: {fen!r}") from None
+        if self.halfmove < 0 or self.fullmove < 1:
+            raise ValueError(f"Invalid FEN move clocks: {fen!r}")
+
+        self.history = []
+        self.prior_keys = []
+        self.mate = None
+        self.key = zobrist.hash_board(self)
+        self.mg, self.eg, self.phase = evaluation.totals(self)
+        self.check_check()
+
+    def to_fen(self) -> str:
+        """Returns FEN string of the position"""
+        rows = []
+        for row in range(8):
+            text = ""
+            empty = 0
+            for piece in self.squares[row * 8 : row * 8 + 8]:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                char = piece.char()
+                text += char if piece.color == Color.WHITE else char.lower()
+            if empty:
+                text += str(empty)
+            rows.append(text)
+        castling = (
+            "".join(
+                char for char, right in FEN_CASTLING.items() if self.castling & right
+            )
+            or "-"
+        )
+        ep = SQUARE_NAMES[self.ep] if self.ep is not None else "-"
+        return (
+            f"{'/'.join(rows)} {repr(self.color)} {castling} {ep} "
+            f"{self.halfmove} {self.fullmove}"
+        )
+
+    def to_bytes(self) -> bytes:
+        """Returns position packed into at most 30 bytes: the header
+        `PACKED_HEADER`, then 4-bit bitboard type indices of the pieces in
+        square order. Move clocks above `MAX_PACKED_CLOCK` are clamped"""
+        occupied = self.occupancy[0] | self.occupancy[1]
+        squares = self.squares
+        codes = 0
+        shift = 0
+        for sq in iter_squares(occupied):
+            codes |= PIECE_INDICES[squares[sq]] << shift
+            shift += 4
+        state = (
+            self.color.index
+            | self.castling << 1
+            | (self.ep + 1 if self.ep is not None else 0) << 5
+            | (self.check.value if self.check is not None else 0) << 12
+            | (self.mate.value if self.mate is not None else 0) << 14
+        )
+        header = PACKED_HEADER.pack(
+            occupied,
+            state,
+            min(self.halfmove, MAX_PACKED_CLOCK),
+            min(self.fullmove, MAX_PACKED_CLOCK),
+        )
+        return header + codes.to_bytes((shift + 4) >> 3, "little")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Board":
+        """Returns board of `to_bytes` data"""
+        board = cls.__new__(cls)
+        board.tablebase = None
+        board.set_bytes(data)
+        return board
+
+    def set_bytes(self, data: bytes) -> None:
+        """Load position from `to_bytes` data, without move history.
+        Raises ValueError if the data is malformed"""
+        size = PACKED_HEADER.size
+        if len(data) < size:
+            raise ValueError("Packed position too short")
+        header = PACKED_HEADER.unpack_from(data)
+        occupied, state, self.halfmove, self.fullmove = header
+        if len(data) != size + (occupied.bit_count() + 1) // 2:
+            raise ValueError("Packed position of wrong length")
+        codes = int.from_bytes(data[size:], "little")
+
+        self._clear()
+        squares = self.squares
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        key = mg = eg = phase = 0
+        for sq in iter_squares(occupied):
+            index = codes & 15
+            codes >>= 4
+            if index >= 12:
+                raise ValueError(f"Invalid packed piece: {index}")
+            color_index = 1 if index >= 6 else 0
+            squares[sq] = PIECES[index]
+            bitboards[index] |= 1 << sq
+            occupancy[color_index] |= 1 << sq
+            key ^= PIECE_KEYS[index][sq]
+            mg += MG_TABLES[index][sq]
+            eg += EG_TABLES[index][sq]
+            phase += PHASE_WEIGHTS[index % 6]
+
+        self.color = Color.BLACK if state & 1 else Color.WHITE
+        self.castling = state >> 1 & 15
+        self.ep = (state >> 5 & 127) - 1 if state >> 5 & 127 else None
+        self.check = Color(state >> 12 & 3) if state >> 12 & 3 else None
+        self.mate = Color(state >> 14) if state >> 14 else None
+        self.endgame = None
+        self.history = []
+        self.prior_keys = []
+        key ^= CASTLING_KEYS[self.castling] ^ ep_key(self)
+        self.key = key ^ SIDE_KEY if self.color == Color.WHITE else key
+        self.mg, self.eg, self.phase = mg, eg, phase
+
+    def _castling_from_field(self) -> int:
+        """Grant castling rights for kings and rooks standing on their home cells"""
+        rights = 0
+        for row, color, kingside, queenside in (
+            (7, Color.WHITE, WHITE_KINGSIDE, WHITE_QUEENSIDE),
+            (0, Color.BLACK, BLACK_KINGSIDE, BLACK_QUEENSIDE),
+        ):
+            king = self.squares[square(row, 4)]
+            if not isinstance(king, King) or king.get_color() != color:
+                continue
+            for rook_col, right in ((7, kingside), (0, queenside)):
+                rook = self.squares[square(row, rook_col)]
+                if isinstance(rook, Rook) and rook.get_color() == color:
+                    rights |= right
+        return rights
 
     def current_player_color(self) -> Color:
         """Returns active color"""
@@ -67,10 +470,11 @@ class Board:
 
     def set_active_color(self, color: Color) -> None:
         self.color = color
+        self.key = zobrist.hash_board(self)
 
     def cell(self, row: int, col: int) -> str:
         """Returns string of two symbols, color and piece type, if cell (row, col) is not empty, else two spaces"""
-        piece = self.field[row][col]
+        piece = self.squares[row * 8 + col]
         if piece is None:
             return "  "
         color = piece.get_color()
@@ -79,43 +483,201 @@ class Board:
 
     def move_piece(self, row: int, col: int, row1: int, col1: int) -> bool:
         """Move piece from point (row, col) to point (row1, col1).
+        Pawn reaching the last row becomes a queen.
         Returns whether move succeeded or not"""
 
-        if not correct_coords(row, col) or not correct_coords(row1, col1):
-            return False
-        if row == row1 and col == col1:
-            return False
-        piece = self.field[row][col]
-        if piece is None:
+        move = self.find_move(row, col, row1, col1)
+        if move is None:
             return False
-        if piece.get_color() != self.color:
+        self.make_move(move)
+        self.check_check()
+        return True
+
+    def play_move(self, move: Move) -> bool:
+        """Play legal move and update check and mate state.
+        Returns whether move succeeded or not"""
+        row, col, _, _ = move.coords()
+        if move not in self.moves_from(row, col):
             return False
-        dest = self.field[row1][col1]
-        if dest is None:
-            if not piece.can_move(self, row, col, row1, col1):
-                if isinstance(piece, King):
-                    if self.can_castle(row, col, row1, col1):
-                        piece.set_moved()
-                        self.color = self.color.opponent()
-                        return self.castle(row, col, row1, col1)
-                return False
-        elif dest.get_color() == piece.get_color().opponent():
-            if not piece.can_attack(self, row, col, row1, col1):
-                return False
-            if isinstance(dest, King):
-                return False
+        self.make_move(move)
+        self.check_check()
+        return True
+
+    def legal_moves(self) -> list[Move]:
+        """Returns all legal moves of the active color"""
+        return list(movegen.legal_moves(self))
+
+    def moves_from(self, row: int, col: int) -> list[Move]:
+        """Returns legal moves of piece in cell (row, col)"""
+        if not correct_coords(row, col):
+            return []
+        candidates = movegen.pseudo_legal_moves(self, bit(row, col))
+        return list(movegen.legal_moves(self, candidates))
+
+    def find_move(
+        self, row: int, col: int, row1: int, col1: int, promotion: str | None = None
+    ) -> Move | None:
+        """Returns legal move from (row, col) to (row1, col1) or None.
+        `promotion`: Piece char for promoting moves, queen if not given
+        """
+        if not correct_coords(row1, col1):
+            return None
+        to_sq = square(row1, col1)
+        for move in self.moves_from(row, col):
+            if move.to_sq != to_sq:
+                continue
+            if promotion is None or move.promotion == promotion:
+                return move
+        return None
+
+    def decode_move(self, code: int) -> Move:
+        """Returns pseudo-legal move of `Move.encode` code, with its flags.
+        Raises ValueError if no piece can make such move"""
+        for move in movegen.pseudo_legal_moves(self, 1 << (code & 63)):
+            if move.encode() == code:
+                return move
+        raise ValueError(f"Invalid move code: {code}")
+
+    def make_move(self, move: Move) -> None:
+        """Play move without validation and pass the turn.
+        The move can be taken back with `unmake_move`"""
+        from_sq, to_sq, promotion, flags = move
+        squares = self.squares
+        piece = squares[from_sq]
+        mover = self.color
+        key = self.key
+        # Castling and en passant parts are hashed again once the move is done
+        self.key ^= CASTLING_KEYS[self.castling] ^ zobrist.ep_key(self)
+
+        if flags & EN_PASSANT:
+            # Captured pawn stands behind the target cell
+            captured_sq = to_sq + 8 if mover == Color.WHITE else to_sq - 8
         else:
-            return False
-        if self.get_check():
-            if not self.protecting_move(row, col, row1, col1):
-                return False
+            captured_sq = to_sq
+        captured = self._remove(captured_sq)
+
+        self._remove(from_sq)
+        if promotion is None:
+            self._put(to_sq, piece)
+        else:
+            self._put(to_sq, PROMOTION_PIECES[promotion](piece.color))
+
+        if flags & CASTLE:
+            rook_from, rook_to = (
+                (to_sq + 1, to_sq - 1) if to_sq > from_sq else (to_sq - 2, to_sq + 1)
+            )
+            self._move(rook_from, rook_to)
+
+        self.history.append(
+            (
+                move,
+                piece,
+                captured,
+                captured_sq,
+                self.castling,
+                self.ep,
+                self.check,
+                self.mate,
+                self.halfmove,
+                self.fullmove,
+                key,
+            )
+        )
+        self.castling &= CASTLING_MASKS[from_sq] & CASTLING_MASKS[to_sq]
+        self.ep = (from_sq + to_sq) >> 1 if flags & DOUBLE_PUSH else None
+        if captured is not None or isinstance(piece, Pawn):
+            self.halfmove = 0
+        else:
+            self.halfmove += 1
+        if mover == Color.BLACK:
+            self.fullmove += 1
+        self.color = mover.opponent()
+        self.key ^= CASTLING_KEYS[self.castling] ^ SIDE_KEY ^ zobrist.ep_key(self)
+        self.check = mover if self.king_attacked(self.color) else None
+        self.mate = None
+
+    def unmake_move(self) -> Move:
+        """Take back the last move made with `make_move` and return it"""
+        (
+            move,
+            piece,
+            captured,
+            captured_sq,
+            self.castling,
+            self.ep,
+            self.check,
+            self.mate,
+            self.halfmove,
+            self.fullmove,
+            key,
+        ) = self.history.pop()
+        from_sq, to_sq, _, flags = move
+
+        # The moved piece is restored from the record, which undoes promotions
+        self._remove(to_sq)
+        self._put(from_sq, piece)
+        if captured is not None:
+            self._put(captured_sq, captured)
+
+        if flags & CASTLE:
+            rook_from, rook_to = (
+                (to_sq + 1, to_sq - 1) if to_sq > from_sq else (to_sq - 2, to_sq + 1)
+            )
+            self._move(rook_to, rook_from)
 
-        piece.set_moved()
-        self.field[row][col] = None
-        self.field[row1][col1] = piece
         self.color = self.color.opponent()
-        self.check_check()
-        return True
+        self.key = key
+        return move
+
+    def is_repetition(self, count: int = 3) -> bool:
+        """Check if current position occurred `count` times,
+        looking back to the last capture or pawn move"""
+        seen = 1
+        for record in reversed(self.history):
+            piece, captured, key = record[1], record[2], record[-1]
+            if captured is not None or isinstance(piece, Pawn):
+                return False
+            if key == self.key:
+                seen += 1
+                if seen >= count:
+                    return True
+        for key in reversed(self.prior_keys):
+            if key == self.key:
+                seen += 1
+                if seen >= count:
+                    return True
+        return False
+
+    def repetition_keys(self) -> list[int]:
+        """Returns keys of the positions since the last capture or pawn move,
+        oldest first, without the current one"""
+        keys = []
+        for record in reversed(self.history):
+            piece, captured, key = record[1], record[2], record[-1]
+            if captured is not None or isinstance(piece, Pawn):
+                break
+            keys.append(key)
+        else:
+            keys.extend(reversed(self.prior_keys))
+        keys.reverse()
+        return keys
+
+    def set_repetition_keys(self, keys: list[int]) -> None:
+        """Take `repetition_keys` of another board as the positions before
+        the history, like after `from_bytes`. Only `is_repetition` sees them"""
+        self.prior_keys = list(keys)
+
+    def king_square(self, color: Color) -> int | None:
+        """Returns square index of `color` king or None if it is missing"""
+        kings = self.bitboards[color.index * 6 + KING]
+        return lsb(kings) if kings else None
+
+    def king_attacked(self, color: Color) -> bool:
+        """Check if `color` king is attacked by the opponent"""
+        sq = self.king_square(color)
+        if sq is None:
+            return False
+        return bool(self.attackers(sq, color.opponent()))
 
     def is_under_attack(self, row: int, col: int, color: Color) -> bool:
         """Check if cell is under attack.
@@ -123,25 +685,99 @@ class Board:
         `col`: Column
         `color`: Attacking side's color
         """
-        for i, j in product(range(8), range(8)):
-            piece = self.field[i][j]
-            if piece is None:
-                continue
-            if piece.get_color() != color:
-                continue
-            # if piece.can_attack(self, i, j, row, col):
-            #     return True
-            if isinstance(piece, King):
-                if piece.can_attack(
-                    self, i, j, row, col, team_check=False, check_check=False
-                ):
-                    return True
-            if piece.can_attack(self, i, j, row, col, team_check=False):
-                return True
-        return False
+        return bool(self.attacked_squares(color) >> (row * 8 + col) & 1)
+
+    def attacked_squares(self, color: Color) -> int:
+        """Returns bitboard of cells attacked by `color`, own pieces included"""
+        index = color.index
+        attacks = self.attack_maps[index]
+        if attacks is not None:
+            return attacks
+
+        square_attacks = self._update_square_attacks()
+        attacks = 0
+        for sq in iter_squares(self.occupancy[index]):
+            attacks |= square_attacks[sq]
+        self.attack_maps[index] = attacks
+        return attacks
+
+    def _update_square_attacks(self) -> list[int]:
+        """Bring `square_attacks` up to date and return it.
+        Only the changed squares and the sliders attacking them now are
+        recomputed: a changed ray of a slider always ends at or beyond the
+        first changed square on it"""
+        square_attacks = self.square_attacks
+        changed = self.changed_squares
+        if square_attacks is None or changed is None:
+            square_attacks = [0] * 64
+            changed = iter_squares(self.occupied())
+        else:
+            bitboards = self.bitboards
+            occupied = self.occupied()
+            diagonal = (
+                bitboards[BISHOP]
+                | bitboards[QUEEN]
+                | bitboards[6 + BISHOP]
+                | bitboards[6 + QUEEN]
+            )
+            straight = (
+                bitboards[ROOK]
+                | bitboards[QUEEN]
+                | bitboards[6 + ROOK]
+                | bitboards[6 + QUEEN]
+            )
+            sliders = 0
+            for sq in changed:
+                sliders |= bishop_attacks(sq, occupied) & diagonal
+                sliders |= rook_attacks(sq, occupied) & straight
+            changed = set(changed)
+            changed.update(iter_squares(sliders))
+        for sq in changed:
+            square_attacks[sq] = self._piece_attacks(sq)
+        self.square_attacks = square_attacks
+        self.changed_squares = []
+        return square_attacks
+
+    def _piece_attacks(self, sq: int) -> int:
+        """Returns bitboard of cells attacked by the piece on `sq`"""
+        piece = self.squares[sq]
+        if piece is None:
+            return 0
+        index = PIECE_INDICES[piece]
+        kind = index % 6
+        if kind == PAWN:
+            return PAWN_ATTACKS[index // 6][sq]
+        if kind == KNIGHT:
+            return KNIGHT_ATTACKS[sq]
+        if kind == KING:
+            return KING_ATTACKS[sq]
+        occupied = self.occupied()
+        if kind == BISHOP:
+            return bishop_attacks(sq, occupied)
+        if kind == ROOK:
+            return rook_attacks(sq, occupied)
+        return bishop_attacks(sq, occupied) | rook_attacks(sq, occupied)
+
+    def attackers(self, sq: int, color: Color, occupied: int | None = None) -> int:
+        """Returns bitboard of `color` pieces attacking square `sq`.
+        `occupied`: Blockers for sliding pieces, current occupancy by default
+        """
+        if occupied is None:
+            occupied = self.occupied()
+        index = color.index
+        bitboards = self.bitboards
+        base = index * 6
+        queens = bitboards[base + QUEEN]
+        return (
+            (PAWN_ATTACKS[1 - index][sq] & bitboards[base + PAWN])
+            | (KNIGHT_ATTACKS[sq] & bitboards[base + KNIGHT])
+            | (KING_ATTACKS[sq] & bitboards[base + KING])
+            | (bishop_attacks(sq, occupied) & (bitboards[base + BISHOP] | queens))
+            | (rook_attacks(sq, occupied) & (bitboards[base + ROOK] | queens))
+        )
 
     def is_promoting_move(self, row, col, row1, col1) -> bool:
-        piece = self.field[row][col]
+        piece = self.squares[square(row, col)]
         if not isinstance(piece, Pawn):
             return False
         if not self.can_move(row, col, row1, col1) and not self.can_attack(
@@ -155,60 +791,34 @@ class Board:
 
     def get_piece(self, row: int, col: int) -> "Piece | None":
         """Returns piece in cell (row, col)"""
-        return self.field[row][col]
+        return self.squares[row * 8 + col]
 
     def move_and_promote_pawn(
         self, row: int, col: int, row1: int, col1: int, char: str
     ) -> bool:
         """Moves and promotes Pawn"""
-        piece = self.get_piece(row, col)
-
-        if piece is None:
-            return False
-        if not isinstance(piece, Pawn):
-            return False
-        if not piece.can_move(self, row, col, row1, col1) and not piece.can_attack(
-            self, row, col, row1, col1
-        ):
-            return False
-        if not (piece.get_color() == Color.WHITE and row1 == 0) and not (
-            piece.get_color() == Color.BLACK and row1 == 7
-        ):
-            return False
-
         # https://pastebin.com/hmaJ5zDx
-        color = piece.get_color()
-
-        if char == "Q":
-            new_piece = Queen(color)
-        elif char == "R":
-            new_piece = Rook(color)
-        elif char == "B":
-            new_piece = Bishop(color)
-        elif char == "N":
-            new_piece = Knight(color)
-        else:
+        if char not in PROMOTION_PIECES:
             return False
 
-        new_piece.set_moved()
-        self.field[row][col] = None
-        self.field[row1][col1] = new_piece
+        move = self.find_move(row, col, row1, col1, char)
+        if move is None or move.promotion is None:
+            return False
+        self.make_move(move)
         self.check_check()
-        self.color = self.color.opponent()
         return True
 
     def check_check(self) -> None:
         """Check if king is under attack"""
         self.check = None
-        for i in range(8):
-            for j in range(8):
-                king_piece = self.field[i][j]
-                if king_piece is None:
-                    continue
-                if isinstance(king_piece, King):
-                    if self.is_under_attack(i, j, king_piece.get_color().opponent()):
-                        self.check = king_piece.get_color().opponent()
-                        self.mate_check(i, j, king_piece)
+        kings = self.bitboards[KING] | self.bitboards[6 + KING]
+        for sq in iter_squares(kings):
+            king_piece = self.squares[sq]
+            i, j = row_col(sq)
+            if self.is_under_attack(i, j, king_piece.get_color().opponent()):
+                self.check = king_piece.get_color().opponent()
+                self.mate_check(i, j, king_piece)
+        self.endgame_check()
 
     def get_check(self) -> Color | None:
         """Returns current check state"""
@@ -216,14 +826,23 @@ class Board:
 
     def mate_check(self, row: int, col: int, king_piece: "King") -> None:
         """Check for mate on board"""
+        color = king_piece.get_color()
+        if color == self.color and next(movegen.legal_moves(self), None) is None:
+            self.mate = color.opponent()
+        else:
+            self.mate = None
 
-        for i, j in product(range(-1, 1), range(-1, 1)):
-            if king_piece.can_move(
-                self, row, col, row + i, col + j
-            ):  # or king_piece.can_attack(self, row, col, row + i, col + j):
-                self.mate = None
-                return
-        self.mate = king_piece.get_color().opponent()
+    def endgame_check(self) -> None:
+        """Look up exact result of the position in endgame tables"""
+        if self.tablebase is None:
+            self.endgame = None
+            return
+        self.endgame = self.tablebase.probe(self)
+
+    def get_endgame(self) -> tuple[int, int] | None:
+        """Returns (result, plies to mate) from endgame tables or None,
+        result is 1 if the side to move wins, 0 draw, -1 loss"""
+        return self.endgame
 
     def get_mate(self) -> Color | None:
         """Returns current mate state"""
@@ -231,113 +850,27 @@ class Board:
 
     def can_move(self, row, col, row1, col1) -> bool:
         """Check for move possibility"""
-        piece = self.field[row][col]
-        if piece is None:
-            return False
-        color = piece.get_color()
-        if self.color != color:
-            return False
-        if self.get_check():
-            if not self.protecting_move(row, col, row1, col1):
-                return False
-        if isinstance(piece, King):
-            if self.can_castle(row, col, row1, col1):
-                return True
-        return piece.can_move(self, row, col, row1, col1)
+        move = self.find_move(row, col, row1, col1)
+        return move is not None and not move.flags & CAPTURE
 
     def protecting_move(self, row, col, row1, col1) -> bool:
-        tmp_board = deepcopy(self)
-        tmp_board.field[row1][col1] = tmp_board.field[row][col]
-        tmp_board.field[row][col] = None
-        tmp_board.color = self.color.opponent()
-        tmp_board.check_check()
-        if tmp_board.get_check():
-            return False
-        return True
+        """Check if move leaves own king safe, False if there is no such move"""
+        return self.find_move(row, col, row1, col1) is not None
 
     def can_attack(self, row, col, row1, col1) -> bool:
         """Check for attack possibility"""
-        piece = self.field[row][col]
-        if piece is None:
-            return False
-        att_piece = self.field[row1][col1]
-        if att_piece is None:
-            return False
-        color = piece.get_color()
-        if self.color != color:
-            return False
-        if self.get_check():
-            if not self.protecting_move(row, col, row1, col1):
-                return False
-        if att_piece.get_color() == color:
-            return False
-        if isinstance(att_piece, King):
-            return False
-        return piece.can_attack(self, row, col, row1, col1)
+        move = self.find_move(row, col, row1, col1)
+        return move is not None and bool(move.flags & CAPTURE)
 
     def can_castle(self, row: int, col: int, row1: int, col1: int) -> bool:
         """Check for castlig possibility"""
-        if col1 == 2:
-            rook_col = 0
-            empty = (1, 2, 3)
-        elif col1 == 6:
-            rook_col = 7
-            empty = (5, 6)
-        else:
-            return False
-
-        if self.get_check():
-            return False
-
-        if row != row1:
-            return False
-
-        king = self.field[row][col]
-
-        if not isinstance(king, King):
-            return False
-
-        if king.get_color() != self.color:
-            return False
-
-        rook = self.field[row][rook_col]
-
-        if not isinstance(rook, Rook):
-            return False
-
-        if rook.get_color() != self.color:
-            return False
-
-        if king.moved() or rook.moved():
-            return False
-
-        for i in empty:
-            if self.field[row][i]:
-                return False
-
-        return True
+        move = self.find_move(row, col, row1, col1)
+        return move is not None and bool(move.flags & CASTLE)
 
     def castle(self, row, col, row1, col1):
-        """Castle"""
-        if not self.can_castle(row, col, row1, col1):
+        """Castle and pass the turn"""
+        move = self.find_move(row, col, row1, col1)
+        if move is None or not move.flags & CASTLE:
             return False
-        if col1 == 2:
-            rook_col = 0
-            rook_col_dest = 3
-        else:
-            rook_col = 7
-            rook_col_dest = 5
-
-        # Move king
-        self.field[row][col1], self.field[row][col] = self.field[row][col], None
-
-        # Move rook
-        self.field[row][rook_col_dest], self.field[row][rook_col] = (
-            self.field[row][rook_col],
-            None,
-        )
-
-        self.field[row][rook_col_dest].set_moved()
-        self.field[row][col1].set_moved()
-
+        self.make_move(move)
         return True
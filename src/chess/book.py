@@ -0,0 +1,243 @@
+"""Polyglot opening book
+
+A book is a file of 16-byte big-endian entries sorted by position key:
+64-bit Zobrist key (the same as `Board.key`), 16-bit move, 16-bit weight
+and 32-bit learn value. The file is memory-mapped and searched in place,
+so opening a book costs nothing however large it is.
+
+Polyglot moves count squares from `a1` and write castling as the king
+taking its own rook; they are converted to and from `Move` here.
+
+Usage: python -m chess.book build GAMES.pgn BOOK.bin [--plies N]
+       python -m chess.book probe BOOK.bin [--fen FEN]
+"""
+
+__all__ = ["Book", "BookEntry", "open_book", "build_book"]
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from typing import Iterator, NamedTuple, TextIO
+
+from .bitboard import KING
+from .board import Board, START_FEN, PIECE_KINDS
+from .move import *
+from .move import PROMOTION_CODES
+from .pgn import read_games
+from . import movegen
+
+DEFAULT_PATH = "book.bin"
+DEFAULT_PLIES = 20
+ENTRY = struct.Struct(">QHHI")
+KEY = struct.Struct(">Q")
+MAX_WEIGHT = 0xFFFF
+
+# Points of the side to move for a game result, the weight of a book move
+RESULT_POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}
+
+
+class BookEntry(NamedTuple):
+    move: Move
+    weight: int
+    learn: int
+
+
+def polyglot_move(move: Move) -> int:
+    """Returns Polyglot code of a move"""
+    from_sq, to_sq, promotion, flags = move
+    if flags & CASTLE:
+        # King takes own rook
+        to_sq = to_sq + 1 if to_sq > from_sq else to_sq - 2
+    return (to_sq ^ 56) | (from_sq ^ 56) << 6 | PROMOTION_CODES[promotion] << 12
+
+
+def _decode(board: Board, code: int) -> Move | None:
+    """Returns legal move of Polyglot code or None"""
+    from_sq = (code >> 6 & 63) ^ 56
+    to_sq = (code & 63) ^ 56
+    piece = board.squares[from_sq]
+    if piece is None:
+        return None
+    target = board.squares[to_sq]
+    if (
+        PIECE_KINDS[type(piece)] == KING
+        and target is not None
+        and target.color == piece.color
+    ):
+        # King takes own rook: castling to the g or c file
+        to_sq = from_sq + 2 if to_sq > from_sq else from_sq - 2
+    try:
+        move = board.decode_move(from_sq | to_sq << 6 | (code >> 12 & 7) << 12)
+    except ValueError:
+        return None
+    return next(movegen.legal_moves(board, [move]), None)
+
+
+class Book:
+    """Memory-mapped Polyglot book"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        # Empty files cannot be mapped
+        self.data = (
+            mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        )
+        self.size = size // ENTRY.size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _first(self, key: int) -> int:
+        """Returns index of first entry with key not less than `key`"""
+        data = self.data
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) >> 1
+            if KEY.unpack_from(data, middle * 16)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _raw(self, key: int) -> list[tuple[int, int, int, int]]:
+        """Returns undecoded entries (key, move code, weight, learn) of key"""
+        data = self.data
+        result = []
+        for index in range(self._first(key), self.size):
+            entry = ENTRY.unpack_from(data, index * 16)
+            if entry[0] != key:
+                break
+            result.append(entry)
+        return result
+
+    def entries(self, board: Board) -> Iterator[BookEntry]:
+        """Yields legal book moves of the position"""
+        for _, code, weight, learn in self._raw(board.key):
+            move = _decode(board, code)
+            if move is not None:
+                yield BookEntry(move, weight, learn)
+
+    def choose(self, board: Board, rng: random.Random | None = None) -> Move | None:
+        """Returns random book move, more likely the higher its weight,
+        or None if the position is not in the book.
+        Only the drawn move is decoded and checked for legality"""
+        entries = [entry for entry in self._raw(board.key) if entry[2]]
+        while entries:
+            weights = [entry[2] for entry in entries]
+            entry = (rng or random).choices(entries, weights)[0]
+            move = _decode(board, entry[1])
+            if move is not None:
+                return move
+            entries.remove(entry)
+        return None
+
+    def best(self, board: Board) -> Move | None:
+        """Returns book move of the highest weight or None"""
+        entries = sorted(self._raw(board.key), key=lambda entry: -entry[2])
+        for _, code, _, _ in entries:
+            move = _decode(board, code)
+            if move is not None:
+                return move
+        return None
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self) -> "Book":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def open_book(path: str = DEFAULT_PATH) -> Book | None:
+    """Returns book of path or None if there is no such file"""
+    if not os.path.exists(path):
+        return None
+    return Book(path)
+
+
+def build_book(
+    stream: TextIO, path: str, plies: int = DEFAULT_PLIES, min_games: int = 1
+) -> int:
+    """Write book of the first `plies` moves of every game in a PGN stream.
+    Moves are weighted by points scored with them: 2 a win, 1 a draw.
+    `min_games`: Moves played in fewer games are left out
+    Returns number of entries"""
+    # (key, move code) -> [games, points]
+    stats: dict[tuple[int, int], list[int]] = {}
+    for game in read_games(stream):
+        points = RESULT_POINTS.get(game.result, (0, 0))
+        try:
+            board = Board(game.headers.get("FEN", START_FEN))
+        except ValueError:
+            # Malformed FEN tag, reported in `game.error`
+            continue
+        for move in game.moves[:plies]:
+            record = stats.setdefault((board.key, polyglot_move(move)), [0, 0])
+            record[0] += 1
+            record[1] += points[board.color.index]
+            board.make_move(move)
+
+    entries = [
+        (key, code, weight_sum)
+        for (key, code), (games, weight_sum) in stats.items()
+        if games >= min_games
+    ]
+    entries.sort()
+    # Scale so the heaviest move fits in 16 bits
+    scale = max((weight_sum for _, _, weight_sum in entries), default=0) / MAX_WEIGHT
+    with open(path, "wb") as f:
+        for key, code, weight_sum in entries:
+            weight = weight_sum
+            if scale > 1:
+                # Rare moves that scored keep weight 1, or they are never chosen
+                weight = max(round(weight_sum / scale), min(weight_sum, 1))
+            f.write(ENTRY.pack(key, code, weight, 0))
+    return len(entries)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """main"""
+    parser = argparse.ArgumentParser(
+        prog="python -m chess.book", description=__doc__.splitlines()[0]
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="make book from PGN games")
+    build.add_argument("pgn")
+    build.add_argument("book")
+    build.add_argument("--plies", type=int, default=DEFAULT_PLIES)
+    build.add_argument("--min-games", type=int, default=1)
+    probe = commands.add_parser("probe", help="list book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=START_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        with open(args.pgn, encoding="utf-8", errors="replace") as stream:
+            count = build_book(stream, args.book, args.plies, args.min_games)
+        print(f"{count} entries written to {args.book}")
+        return 0
+
+    board = Board.from_fen(args.fen)
+    with Book(args.book) as book:
+        start = time.perf_counter()
+        entries = list(book.entries(board))
+        elapsed = time.perf_counter() - start
+        total = sum(entry.weight for entry in entries) or 1
+        for entry in sorted(entries, key=lambda entry: -entry.weight):
+            print(f"{entry.move.uci():6} {entry.weight:>6} {entry.weight / total:6.1%}")
+        print(f"{len(entries)} moves of {len(book)} entries in {elapsed * 1e6:.0f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
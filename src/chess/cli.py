@@ -1,5 +1,9 @@
 from .utils import *
 from .board import Board
+from . import engine
+from .book import open_book
+from .tablebase import open_tablebase
+from .pgn import parse_san, san
 
 
 def print_board(board):
@@ -19,13 +23,17 @@ def print_board(board):
 
 def main():
     """main"""
-    board = Board()
+    book = open_book()
+    tablebase = open_tablebase()
+    board = Board(tablebase=tablebase)
 
     while True:
         print_board(board)
 
         print(
-            f"Commands:\n\texit\t\t\t\t-- exit\n\tmove <row> <col> <row1> <col1>\t\t\t\t-- move from (row, col) to (row1, col1)"
+            "Commands:\n\texit\t\t\t\t-- exit\n\tmove <row> <col> <row1> <col1>\t\t\t\t-- move from (row, col) to (row1, col1)"
+            "\n\tmove <san>\t\t\t\t-- move in algebraic notation, like `Nf3` or `exd5`"
+            "\n\tengine [depth]\t\t\t\t-- let the computer move"
         )
 
         if board.current_player_color() == Color.WHITE:
@@ -35,8 +43,38 @@ def main():
         command = input()
         if command == "exit":
             break
-        _, row, col, row1, col1 = command.split()
-        row, col, row1, col1 = int(row), int(col), int(row1), int(col1)
+        if command.startswith("engine"):
+            args = command.split()[1:]
+            try:
+                depth = int(args[0]) if args else None
+            except ValueError:
+                depth = 0
+            if len(args) > 1 or depth is not None and depth < 1:
+                print("Usage: engine [depth], depth is a positive number")
+                continue
+            result = engine.search(board, depth=depth, book=book, tablebase=tablebase)
+            if result.move is None or not board.play_move(result.move):
+                print("No moves left")
+                continue
+            source = "book" if result.depth == 0 else f"score {result.score}"
+            print(f"Engine played {result.move.uci()} ({source})")
+            continue
+        args = command.split()[1:]
+        if len(args) == 1:
+            try:
+                move = parse_san(board, args[0])
+            except ValueError as e:
+                print(f"{e}! Try again!")
+                continue
+            print(f"Turn succeeded: {san(board, move)}")
+            board.play_move(move)
+            continue
+        try:
+            # Wrong count of values raises ValueError as well
+            row, col, row1, col1 = map(int, args)
+        except ValueError:
+            print("Usage: move <row> <col> <row1> <col1> or move <san>")
+            continue
         if board.move_piece(row, col, row1, col1):
             print("Turn succeeded")
         else:
@@ -0,0 +1,361 @@
+"""Alpha-beta search engine
+
+Negamax with alpha-beta pruning, iterative deepening, quiescence search
+and move ordering by MVV-LVA, killer moves and the history heuristic.
+Results are cached in a transposition table keyed by `Board.key`.
+Positions found in the opening book are answered without searching, and
+positions found in endgame tables are scored exactly.
+The board is searched in place with make/unmake and is left unchanged.
+A search can be stopped from another thread and reports every completed
+iteration to a callback, see `chess.uci`.
+"""
+
+__all__ = ["MATE_SCORE", "SearchResult", "search"]
+
+import random
+import time
+from threading import Event
+from typing import Callable, NamedTuple
+
+from .board import Board, PIECE_KINDS
+from .book import Book
+from .tablebase import Tablebase
+from .evaluation import PIECE_VALUES, evaluate
+from .move import *
+from .transposition import *
+from . import movegen
+
+MATE_SCORE = 100_000
+INFINITY = 1_000_000
+MAX_PLY = 64
+DEFAULT_DEPTH = 4
+DEFAULT_TT_MB = 16
+# Tablebase mates are up to 254 plies away from the probed node
+MATE_BOUND = MATE_SCORE - MAX_PLY - 256
+
+# Nodes searched between two clock and stop checks, a few milliseconds
+CHECK_INTERVAL = 256
+
+# Move ordering buckets
+CAPTURE_ORDER = 1_000_000
+PROMOTION_ORDER = 900_000
+KILLER_ORDER = 800_000
+
+PROMOTION_KINDS = {"N": 1, "B": 2, "R": 3, "Q": 4}
+
+
+class SearchResult(NamedTuple):
+    """Outcome of the deepest completed iteration"""
+
+    move: Move | None
+    score: int
+    pv: list[Move]
+    depth: int
+    nodes: int
+    time: float
+
+    @property
+    def nps(self) -> int:
+        return int(self.nodes / self.time) if self.time > 0 else 0
+
+    def mate_in(self) -> int | None:
+        """Returns moves to mate, negative if getting mated, None if no mate found"""
+        if abs(self.score) < MATE_BOUND:
+            return None
+        plies = MATE_SCORE - abs(self.score)
+        moves = (plies + 1) // 2
+        return moves if self.score > 0 else -moves
+
+
+class SearchTimeout(Exception):
+    """Raised inside the tree when the time limit is over or on stop"""
+
+
+class Searcher:
+    """Search state of one `search` call"""
+
+    def __init__(
+        self,
+        board: Board,
+        tt: TranspositionTable,
+        deadline: float | None = None,
+        tablebase: Tablebase | None = None,
+        stop: Event | None = None,
+        seed: int | None = None,
+        max_nodes: int | None = None,
+    ) -> None:
+        self.board = board
+        self.tt = tt
+        self.deadline = deadline
+        self.tablebase = tablebase
+        self.stop = stop
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.killers: list[list[Move | None]] = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [[0] * 64 for _ in range(64)]
+        self.pv: list[list[Move]] = [[] for _ in range(MAX_PLY + 1)]
+        self.root_move: Move | None = None
+        self.rng = random.Random(seed) if seed is not None else None
+
+    def _count(self) -> None:
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeout
+            if self.stop is not None and self.stop.is_set():
+                raise SearchTimeout
+            if self.max_nodes is not None and self.nodes >= self.max_nodes:
+                raise SearchTimeout
+
+    def _order(self, moves: list[Move], ply: int, best: Move | None) -> list[Move]:
+        squares = self.board.squares
+        killers = self.killers[ply]
+        history = self.history
+
+        def key(move: Move) -> int:
+            if move == best:
+                return INFINITY
+            from_sq, to_sq, promotion, flags = move
+            if flags & CAPTURE:
+                # Most valuable victim first, least valuable attacker first
+                victim = squares[to_sq]
+                victim_value = (
+                    PIECE_VALUES[PIECE_KINDS[type(victim)]] if victim else 100
+                )
+                attacker_value = PIECE_VALUES[PIECE_KINDS[type(squares[from_sq])]]
+                return CAPTURE_ORDER + 10 * victim_value - attacker_value
+            if promotion is not None:
+                return PROMOTION_ORDER + PROMOTION_KINDS[promotion]
+            if move == killers[0]:
+                return KILLER_ORDER + 1
+            if move == killers[1]:
+                return KILLER_ORDER
+            return history[from_sq][to_sq]
+
+        return sorted(moves, key=key, reverse=True)
+
+    def _store_quiet(self, move: Move, depth: int, ply: int) -> None:
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[move.from_sq][move.to_sq] += depth * depth
+
+    def negamax(self, depth: int, alpha: int, beta: int, ply: int) -> int:
+        """Returns score of position for the side to move"""
+        self._count()
+        board = self.board
+        pv = self.pv
+        pv[ply] = []
+
+        if ply and board.is_repetition(2):
+            return 0
+        if ply and self.tablebase is not None:
+            found = self.tablebase.probe(board)
+            if found is not None:
+                result, plies = found
+                return result * (MATE_SCORE - ply - plies) if result else 0
+        in_check = board.check is not None if ply else board.king_attacked(board.color)
+        if in_check:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiescence(alpha, beta, ply)
+
+        tt_code = 0
+        entry = self.tt.probe(board.key)
+        if entry is not None:
+            entry_depth, score, bound, tt_code = entry
+            # Mate scores are stored relative to the node, not the root
+            if score >= MATE_BOUND:
+                score -= ply
+            elif score <= -MATE_BOUND:
+                score += ply
+            if ply and entry_depth >= depth:
+                if (
+                    bound == EXACT
+                    or (bound == LOWER and score >= beta)
+                    or (bound == UPPER and score <= alpha)
+                ):
+                    return score
+
+        color = board.color
+        moves = list(movegen.pseudo_legal_moves(board))
+        hint = self.root_move if ply == 0 else None
+        if tt_code:
+            hint = next((move for move in moves if move.encode() == tt_code), hint)
+        moves = self._order(moves, ply, hint)
+        if ply == 0 and self.rng is not None:
+            # Helper searches try the root moves after the best one in own order
+            rest = moves[1:]
+            self.rng.shuffle(rest)
+            moves[1:] = rest
+        alpha_start = alpha
+        best = -INFINITY
+        best_move = None
+        legal = 0
+        for move in moves:
+            board.make_move(move)
+            if board.king_attacked(color):
+                board.unmake_move()
+                continue
+            legal += 1
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    pv[ply] = [move] + pv[ply + 1]
+                    if score >= beta:
+                        if not move.flags & CAPTURE and move.promotion is None:
+                            self._store_quiet(move, depth, ply)
+                        break
+
+        if not legal:
+            return -MATE_SCORE + ply if in_check else 0
+
+        if best <= alpha_start:
+            bound = UPPER
+        elif best >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        stored = best
+        if stored >= MATE_BOUND:
+            stored += ply
+        elif stored <= -MATE_BOUND:
+            stored -= ply
+        self.tt.store(board.key, depth, stored, bound, best_move.encode())
+        return best
+
+    def complete_pv(self, pv: list[Move], depth: int) -> list[Move]:
+        """Extend PV cut short by table hits with best moves from the table"""
+        board = self.board
+        pv = list(pv)
+        for move in pv:
+            board.make_move(move)
+        seen = set()
+        while len(pv) < depth and board.key not in seen:
+            seen.add(board.key)
+            entry = self.tt.probe(board.key)
+            if entry is None or not entry[3]:
+                break
+            code = entry[3]
+            move = next((m for m in board.legal_moves() if m.encode() == code), None)
+            if move is None:
+                break
+            board.make_move(move)
+            pv.append(move)
+        for _ in pv:
+            board.unmake_move()
+        return pv
+
+    def quiescence(self, alpha: int, beta: int, ply: int) -> int:
+        """Search captures only until the position is quiet"""
+        self._count()
+        board = self.board
+        self.pv[ply] = []
+
+        best = evaluate(board)
+        if best >= beta or ply >= MAX_PLY:
+            return best
+        alpha = max(alpha, best)
+
+        color = board.color
+        moves = [
+            move
+            for move in movegen.pseudo_legal_moves(board)
+            if move.flags & CAPTURE or move.promotion == "Q"
+        ]
+        for move in self._order(moves, ply, None):
+            board.make_move(move)
+            if board.king_attacked(color):
+                board.unmake_move()
+                continue
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            board.unmake_move()
+
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return best
+
+
+def search(
+    board: Board,
+    depth: int | None = None,
+    movetime: float | None = None,
+    tt: TranspositionTable | None = None,
+    book: Book | None = None,
+    tablebase: Tablebase | None = None,
+    stop: Event | None = None,
+    info: Callable[[SearchResult], None] | None = None,
+    seed: int | None = None,
+    nodes: int | None = None,
+) -> SearchResult:
+    """Find best move for the side to move.
+    `depth`: Maximum depth in plies, unlimited with only `movetime` or `nodes`
+    `movetime`: Hard time limit in seconds, also for the first iteration
+    `tt`: Table to reuse between searches, a new one is made if not given
+    `book`: Opening book consulted first, a book move has depth 0
+    `tablebase`: Endgame tables probed below the root
+    `stop`: Ends the search like the time limit once set
+    `info`: Called with the result of every completed iteration
+    `seed`: Shuffles the root moves after the best one, for parallel helpers
+    `nodes`: Stops like the time limit after about this many nodes
+    """
+    start = time.perf_counter()
+    if book is not None and (move := book.choose(board)) is not None:
+        return SearchResult(move, 0, [move], 0, 0, time.perf_counter() - start)
+
+    if depth is None:
+        depth = MAX_PLY if movetime is not None or nodes is not None else DEFAULT_DEPTH
+    if tt is None:
+        tt = TranspositionTable(DEFAULT_TT_MB)
+    tt.new_search()
+    deadline = start + movetime if movetime is not None else None
+    searcher = Searcher(board, tt, deadline, tablebase, stop, seed, nodes)
+    history_length = len(board.history)
+
+    legal = board.legal_moves()
+    result = SearchResult(legal[0] if legal else None, 0, legal[:1], 0, 0, 0.0)
+    if not legal:
+        score = -MATE_SCORE if board.king_attacked(board.color) else 0
+        return result._replace(score=score)
+
+    for current_depth in range(1, depth + 1):
+        try:
+            score = searcher.negamax(current_depth, -INFINITY, INFINITY, 0)
+        except SearchTimeout:
+            # Take back moves left on the board by the interrupted iteration
+            while len(board.history) > history_length:
+                board.unmake_move()
+            if not result.depth and searcher.pv[0]:
+                # First iteration cut short: best root move found so far
+                result = result._replace(move=searcher.pv[0][0], pv=searcher.pv[0][:1])
+            break
+        pv = searcher.complete_pv(searcher.pv[0], current_depth)
+        searcher.root_move = pv[0] if pv else None
+        result = SearchResult(
+            searcher.root_move or result.move,
+            score,
+            pv,
+            current_depth,
+            searcher.nodes,
+            time.perf_counter() - start,
+        )
+        if info is not None:
+            info(result)
+        if abs(score) >= MATE_BOUND:
+            break
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        if stop is not None and stop.is_set():
+            break
+
+    return result._replace(nodes=searcher.nodes, time=time.perf_counter() - start)
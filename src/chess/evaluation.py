@@ -0,0 +1,259 @@
+"""Static position evaluation
+
+Material plus piece-square tables with separate middlegame and endgame
+values, blended by the amount of material left on the board.
+Tables are written from white's side with row 0 on top, like `Board.field`.
+
+The board keeps the middlegame and endgame sums and the phase as running
+totals, updated whenever a piece is put or removed, so `evaluate` only
+blends them. With `DEBUG` set every call checks them against `totals`.
+
+`evaluate_full` adds mobility and pawn structure terms. It is the scalar
+reference of the batch evaluator in `chess.vectorized`; the engine uses
+the cheaper `evaluate`.
+"""
+
+__all__ = [
+    "PIECE_VALUES",
+    "MG_TABLES",
+    "EG_TABLES",
+    "PHASE_WEIGHTS",
+    "MOBILITY_WEIGHTS",
+    "evaluate",
+    "totals",
+    "mobility",
+    "pawn_structure",
+    "evaluate_full",
+]
+
+from typing import TYPE_CHECKING
+
+from .bitboard import *
+from .attacks import *
+
+if TYPE_CHECKING:
+    from .board import Board
+
+# Pawn, knight, bishop, rook, queen, king
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+
+# Game phase contribution of every piece type, 24 is a full middlegame
+PHASE_WEIGHTS = (0, 1, 1, 2, 4, 0)
+MAX_PHASE = 24
+
+# Check the running totals of the board against a full recount
+DEBUG = False
+
+# Centipawns per square attacked by the pieces of a type, not taken by own pieces
+MOBILITY_WEIGHTS = (0, 4, 5, 2, 1, 0)
+# Per pawn more than one on a file, and per pawn without pawns on next files
+DOUBLED_PAWN = -10
+ISOLATED_PAWN = -15
+# Passed pawn bonus by rows left to promotion
+PASSED_PAWN = (0, 120, 80, 50, 30, 15, 10, 0)
+
+FILES = [sum(1 << (row * 8 + col) for row in range(8)) for col in range(8)]
+ADJACENT_FILES = [
+    (FILES[col - 1] if col > 0 else 0) | (FILES[col + 1] if col < 7 else 0)
+    for col in range(8)
+]
+# FRONT_SPANS[color index][square]: own and next files ahead of a pawn
+FRONT_SPANS = [
+    [
+        sum(
+            1 << (row * 8 + col)
+            for row in (range(sq >> 3) if color_index == 0 else range((sq >> 3) + 1, 8))
+            for col in range(max((sq & 7) - 1, 0), min((sq & 7) + 2, 8))
+        )
+        for sq in range(64)
+    ]
+    for color_index in (0, 1)
+]
+
+# fmt: off
+PAWN_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0,
+)
+PAWN_ENDGAME_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+    80,  80,  80,  80,  80,  80,  80,  80,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    30,  30,  30,  30,  30,  30,  30,  30,
+    20,  20,  20,  20,  20,  20,  20,  20,
+    10,  10,  10,  10,  10,  10,  10,  10,
+     0,   0,   0,   0,   0,   0,   0,   0,
+     0,   0,   0,   0,   0,   0,   0,   0,
+)
+KNIGHT_TABLE = (
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_TABLE = (
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0,
+)
+QUEEN_TABLE = (
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+)
+KING_TABLE = (
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20,
+)
+KING_ENDGAME_TABLE = (
+   -50, -40, -30, -20, -20, -30, -40, -50,
+   -30, -20, -10,   0,   0, -10, -20, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -30,   0,   0,   0,   0, -30, -30,
+   -50, -30, -30, -30, -30, -30, -30, -50,
+)
+# fmt: on
+
+_MG = (PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE)
+_EG = (
+    PAWN_ENDGAME_TABLE,
+    KNIGHT_TABLE,
+    BISHOP_TABLE,
+    ROOK_TABLE,
+    QUEEN_TABLE,
+    KING_ENDGAME_TABLE,
+)
+
+
+def _combined(tables: tuple[tuple[int, ...], ...]) -> list[list[int]]:
+    """Material plus table value by bitboard index and square, from white's side.
+    Black uses the table mirrored vertically and negated"""
+    result = []
+    for color_index in (0, 1):
+        for kind, table in enumerate(tables):
+            sign = 1 if color_index == 0 else -1
+            flip = 0 if color_index == 0 else 56
+            result.append(
+                [sign * (PIECE_VALUES[kind] + table[sq ^ flip]) for sq in range(64)]
+            )
+    return result
+
+
+# MG_TABLES[bitboard index][square]: signed score, positive is good for white
+MG_TABLES = _combined(_MG)
+EG_TABLES = _combined(_EG)
+
+
+def totals(board: "Board") -> tuple[int, int, int]:
+    """Returns middlegame and endgame sums and phase, counted from scratch"""
+    mg = eg = phase = 0
+    for index, bitboard in enumerate(board.bitboards):
+        if not bitboard:
+            continue
+        mg_table = MG_TABLES[index]
+        eg_table = EG_TABLES[index]
+        for sq in iter_squares(bitboard):
+            mg += mg_table[sq]
+            eg += eg_table[sq]
+            phase += PHASE_WEIGHTS[index % 6]
+    return mg, eg, phase
+
+
+def evaluate(board: "Board") -> int:
+    """Returns score in centipawns from the side to move's point of view"""
+    if DEBUG:
+        expected = totals(board)
+        actual = (board.mg, board.eg, board.phase)
+        assert actual == expected, f"Running totals {actual} != {expected}"
+    phase = min(board.phase, MAX_PHASE)
+    score = (board.mg * phase + board.eg * (MAX_PHASE - phase)) // MAX_PHASE
+    return score if board.color.index == 0 else -score
+
+
+def mobility(board: "Board") -> int:
+    """Returns mobility score, positive is good for white.
+    Counts squares attacked by all pieces of a type together"""
+    occupied = board.occupancy[0] | board.occupancy[1]
+    score = 0
+    for color_index, sign in ((0, 1), (1, -1)):
+        own = board.occupancy[color_index]
+        for kind in (KNIGHT, BISHOP, ROOK, QUEEN):
+            attacked = 0
+            for sq in iter_squares(board.bitboards[color_index * 6 + kind]):
+                if kind == KNIGHT:
+                    attacked |= KNIGHT_ATTACKS[sq]
+                elif kind == BISHOP:
+                    attacked |= bishop_attacks(sq, occupied)
+                elif kind == ROOK:
+                    attacked |= rook_attacks(sq, occupied)
+                else:
+                    attacked |= queen_attacks(sq, occupied)
+            score += sign * MOBILITY_WEIGHTS[kind] * (attacked & ~own).bit_count()
+    return score
+
+
+def pawn_structure(board: "Board") -> int:
+    """Returns score of doubled, isolated and passed pawns, positive is good
+    for white"""
+    score = 0
+    for color_index, sign in ((0, 1), (1, -1)):
+        pawns = board.bitboards[color_index * 6 + PAWN]
+        enemy = board.bitboards[(1 - color_index) * 6 + PAWN]
+        spans = FRONT_SPANS[color_index]
+        for col in range(8):
+            count = (pawns & FILES[col]).bit_count()
+            if count > 1:
+                score += sign * DOUBLED_PAWN * (count - 1)
+        for sq in iter_squares(pawns):
+            if not pawns & ADJACENT_FILES[sq & 7]:
+                score += sign * ISOLATED_PAWN
+            if not enemy & spans[sq]:
+                rows_left = sq >> 3 if color_index == 0 else 7 - (sq >> 3)
+                score += sign * PASSED_PAWN[rows_left]
+    return score
+
+
+def evaluate_full(board: "Board") -> int:
+    """Returns `evaluate` plus mobility and pawn structure, from the side
+    to move's point of view"""
+    extra = mobility(board) + pawn_structure(board)
+    return evaluate(board) + (extra if board.color.index == 0 else -extra)
@@ -0,0 +1,90 @@
+"""Move representation"""
+
+__all__ = [
+    "Move",
+    "CAPTURE",
+    "CASTLE",
+    "EN_PASSANT",
+    "DOUBLE_PUSH",
+    "pack_moves",
+    "unpack_codes",
+]
+
+import sys
+from array import array
+from typing import Iterable, NamedTuple
+
+from .bitboard import SQUARE_NAMES
+
+# Move flags
+CAPTURE = 1
+CASTLE = 2
+EN_PASSANT = 4
+DOUBLE_PUSH = 8
+
+PROMOTION_CODES = {None: 0, "N": 1, "B": 2, "R": 3, "Q": 4}
+PROMOTION_CHARS = (None, "N", "B", "R", "Q")
+
+
+class Move(NamedTuple):
+    """Move from square `from_sq` to `to_sq`, squares are `row * 8 + col`.
+    `promotion`: Piece char the pawn turns into (`Q`, `R`, `B`, `N`) or None
+    `flags`: Bit mask of move flags
+    """
+
+    from_sq: int
+    to_sq: int
+    promotion: str | None = None
+    flags: int = 0
+
+    @classmethod
+    def from_coords(
+        cls,
+        row: int,
+        col: int,
+        row1: int,
+        col1: int,
+        promotion: str | None = None,
+        flags: int = 0,
+    ) -> "Move":
+        return cls(row * 8 + col, row1 * 8 + col1, promotion, flags)
+
+    def coords(self) -> tuple[int, int, int, int]:
+        """Returns (row, col, row1, col1)"""
+        return self.from_sq >> 3, self.from_sq & 7, self.to_sq >> 3, self.to_sq & 7
+
+    def is_capture(self) -> bool:
+        return bool(self.flags & CAPTURE)
+
+    def is_castle(self) -> bool:
+        return bool(self.flags & CASTLE)
+
+    def uci(self) -> str:
+        """Returns move in coordinate notation, like `e2e4` or `e7e8q`"""
+        promotion = self.promotion.lower() if self.promotion else ""
+        return SQUARE_NAMES[self.from_sq] + SQUARE_NAMES[self.to_sq] + promotion
+
+    def encode(self) -> int:
+        """Returns 16-bit code of squares and promotion, flags are not kept"""
+        return self.from_sq | self.to_sq << 6 | PROMOTION_CODES[self.promotion] << 12
+
+    @classmethod
+    def decode(cls, code: int) -> "Move":
+        """Returns move without flags from `encode` result"""
+        return cls(code & 63, code >> 6 & 63, PROMOTION_CHARS[code >> 12 & 7])
+
+
+def pack_moves(moves: Iterable[Move]) -> bytes:
+    """Returns `Move.encode` codes as 16-bit little-endian words"""
+    codes = array("H", (move.encode() for move in moves))
+    if sys.byteorder == "big":
+        codes.byteswap()
+    return codes.tobytes()
+
+
+def unpack_codes(data: bytes) -> list[int]:
+    """Returns move codes packed by `pack_moves`"""
+    codes = array("H", data)
+    if sys.byteorder == "big":
+        codes.byteswap()
+    return codes.tolist()
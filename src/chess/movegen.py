@@ -0,0 +1,131 @@
+"""Move generation
+
+`pseudo_legal_moves` follows piece movement rules only, `legal_moves`
+additionally drops moves that leave own king under attack.
+The board must not be changed while a generator is being consumed.
+"""
+
+__all__ = ["pseudo_legal_moves", "legal_moves"]
+
+from typing import Iterator, TYPE_CHECKING
+
+from .bitboard import *
+from .attacks import *
+from .move import *
+
+if TYPE_CHECKING:
+    from .board import Board
+
+PROMOTION_CHARS = ("Q", "R", "B", "N")
+
+# King cell, target cell, rook cell, cells that must be empty, cells that must
+# not be attacked and castling right bit for white; black ones are mirrored
+_CASTLINGS = (
+    (60, 62, 63, (61, 62), (60, 61, 62), 1),
+    (60, 58, 56, (57, 58, 59), (60, 59, 58), 2),
+)
+
+
+def _pawn_moves(
+    board: "Board", us: int, own: int, enemy: int, sources: int
+) -> Iterator[Move]:
+    occupied = own | enemy
+    if us == 0:
+        push, start_row, last_row = -8, 6, 0
+    else:
+        push, start_row, last_row = 8, 1, 7
+    attacks = PAWN_ATTACKS[us]
+    ep = board.ep
+
+    for sq in iter_squares(board.bitboards[us * 6 + PAWN] & sources):
+        to_sq = sq + push
+        promotes = to_sq >> 3 == last_row
+        if not occupied >> to_sq & 1:
+            if promotes:
+                for char in PROMOTION_CHARS:
+                    yield Move(sq, to_sq, char)
+            else:
+                yield Move(sq, to_sq)
+                double = to_sq + push
+                if sq >> 3 == start_row and not occupied >> double & 1:
+                    yield Move(sq, double, None, DOUBLE_PUSH)
+        targets = attacks[sq]
+        for to_sq in iter_squares(targets & enemy):
+            if promotes:
+                for char in PROMOTION_CHARS:
+                    yield Move(sq, to_sq, char, CAPTURE)
+            else:
+                yield Move(sq, to_sq, None, CAPTURE)
+        if ep is not None and targets >> ep & 1:
+            yield Move(sq, ep, None, CAPTURE | EN_PASSANT)
+
+
+def _castling_moves(board: "Board", us: int, occupied: int) -> Iterator[Move]:
+    them = board.color.opponent()
+    kings = board.bitboards[us * 6 + KING]
+    rooks = board.bitboards[us * 6 + ROOK]
+    shift = 2 * us
+    # Black home row is 56 squares above the white one
+    offset = -56 * us
+    for king_sq, to_sq, rook_sq, empty, passed, right in _CASTLINGS:
+        if not board.castling & (right << shift):
+            continue
+        if not kings >> (king_sq + offset) & 1 or not rooks >> (rook_sq + offset) & 1:
+            continue
+        if any(occupied >> (sq + offset) & 1 for sq in empty):
+            continue
+        if any(board.attackers(sq + offset, them, occupied) for sq in passed):
+            continue
+        yield Move(king_sq + offset, to_sq + offset, None, CASTLE)
+
+
+def pseudo_legal_moves(board: "Board", sources: int = ~0) -> Iterator[Move]:
+    """Yields moves allowed by piece rules, own king safety is not checked.
+    `sources`: Bitboard of cells to generate moves from, all by default
+    """
+    us = board.color.index
+    bitboards = board.bitboards
+    own = board.occupancy[us]
+    enemy = board.occupancy[1 - us]
+    occupied = own | enemy
+    not_own = ~own
+    base = us * 6
+
+    yield from _pawn_moves(board, us, own, enemy, sources)
+
+    # Capture flag is taken straight from the enemy occupancy bit (CAPTURE == 1)
+    for sq in iter_squares(bitboards[base + KNIGHT] & sources):
+        for to_sq in iter_squares(KNIGHT_ATTACKS[sq] & not_own):
+            yield Move(sq, to_sq, None, enemy >> to_sq & 1)
+    for sq in iter_squares(bitboards[base + BISHOP] & sources):
+        for to_sq in iter_squares(bishop_attacks(sq, occupied) & not_own):
+            yield Move(sq, to_sq, None, enemy >> to_sq & 1)
+    for sq in iter_squares(bitboards[base + ROOK] & sources):
+        for to_sq in iter_squares(rook_attacks(sq, occupied) & not_own):
+            yield Move(sq, to_sq, None, enemy >> to_sq & 1)
+    for sq in iter_squares(bitboards[base + QUEEN] & sources):
+        for to_sq in iter_squares(queen_attacks(sq, occupied) & not_own):
+            yield Move(sq, to_sq, None, enemy >> to_sq & 1)
+    kings = bitboards[base + KING] & sources
+    for sq in iter_squares(kings):
+        for to_sq in iter_squares(KING_ATTACKS[sq] & not_own):
+            yield Move(sq, to_sq, None, enemy >> to_sq & 1)
+
+    if kings:
+        yield from _castling_moves(board, us, occupied)
+
+
+def legal_moves(board: "Board", moves: Iterator[Move] | None = None) -> Iterator[Move]:
+    """Yields legal moves of the active color.
+    `moves`: Candidate moves, all pseudo-legal moves by default
+    """
+    color = board.color
+    if moves is None:
+        moves = pseudo_legal_moves(board)
+    # Collect first: the board changes while candidates are tested
+    for move in list(moves):
+        board.make_move(move)
+        legal = not board.king_attacked(color)
+        board.unmake_move()
+        if legal:
+            yield move
@@ -0,0 +1,149 @@
+"""Parallel search over a process pool (Lazy SMP)
+
+Every worker searches the same position on its own copy of the board, and
+all workers share one transposition table in shared memory, so what one
+worker finds cuts the trees of the others. Every worker takes exactly one
+task of a search, helpers try the root moves in their own shuffled order
+and odd workers search one ply deeper to spread the work. The deepest
+completed result wins.
+
+Usage: python -m chess.parallel [-w WORKERS] [-t MOVETIME] [--fen FEN]
+Runs the search with 1, 2, 4, ... workers and reports nodes per second.
+"""
+
+__all__ = ["ParallelSearch", "parallel_search"]
+
+import argparse
+import os
+import sys
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from multiprocessing.synchronize import Barrier
+
+from .board import Board, START_FEN
+from .engine import DEFAULT_TT_MB, SearchResult, search
+from .transposition import AGE_MASK, TranspositionTable
+
+# Table of the worker process, attached to shared memory by `_init_worker`
+_worker_memory: shared_memory.SharedMemory | None = None
+_worker_tt: TranspositionTable | None = None
+# Held by every task until all workers have one, so none takes two
+_worker_barrier: Barrier | None = None
+
+
+def _init_worker(name: str, barrier: Barrier) -> None:
+    global _worker_memory, _worker_tt, _worker_barrier
+    _worker_memory = shared_memory.SharedMemory(name=name)
+    _worker_tt = TranspositionTable(buffer=_worker_memory.buf)
+    _worker_barrier = barrier
+
+
+def _worker_search(
+    board: Board, depth: int | None, movetime: float | None, helper: int, age: int
+) -> SearchResult:
+    _worker_barrier.wait()
+    if depth is not None:
+        depth += helper % 2
+    # `search` starts a new search on the table, which brings it to `age`
+    _worker_tt.age = (age - 1) & AGE_MASK
+    seed = helper if helper else None
+    return search(board, depth, movetime, _worker_tt, seed=seed)
+
+
+class ParallelSearch:
+    """Process pool with a shared transposition table, reused between searches"""
+
+    def __init__(self, workers: int | None = None, tt_mb: float = DEFAULT_TT_MB):
+        """`workers`: Number of processes, CPU count by default
+        `tt_mb`: Size of the shared transposition table in megabytes
+        """
+        self.workers = workers or os.cpu_count() or 1
+        size = TranspositionTable.bytes_for(tt_mb)
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+        self.barrier = multiprocessing.Barrier(self.workers)
+        self.executor = ProcessPoolExecutor(
+            self.workers,
+            initializer=_init_worker,
+            initargs=(self.memory.name, self.barrier),
+        )
+        # Search age of the shared table, the workers' own ages are not kept
+        self.age = 0
+
+    def search(
+        self, board: Board, depth: int | None = None, movetime: float | None = None
+    ) -> SearchResult:
+        """Same as `engine.search`, nodes are summed over all workers"""
+        start = time.perf_counter()
+        self.age = (self.age + 1) & AGE_MASK
+        futures = [
+            self.executor.submit(_worker_search, board, depth, movetime, i, self.age)
+            for i in range(self.workers)
+        ]
+        results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+
+        # Deepest result, the first worker wins ties
+        best = max(results, key=lambda result: result.depth)
+        return best._replace(
+            nodes=sum(result.nodes for result in results), time=elapsed
+        )
+
+    def close(self) -> None:
+        self.executor.shutdown()
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self) -> "ParallelSearch":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def parallel_search(
+    board: Board,
+    depth: int | None = None,
+    movetime: float | None = None,
+    workers: int | None = None,
+) -> SearchResult:
+    """Run one search with a temporary process pool"""
+    with ParallelSearch(workers) as searcher:
+        return searcher.search(board, depth, movetime)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """main"""
+    parser = argparse.ArgumentParser(
+        prog="python -m chess.parallel", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-t", "--movetime", type=float, default=5.0)
+    parser.add_argument("--fen", default=START_FEN)
+    args = parser.parse_args(argv)
+
+    board = Board.from_fen(args.fen)
+    counts = []
+    count = 1
+    while count < args.workers:
+        counts.append(count)
+        count *= 2
+    counts.append(args.workers)
+
+    base_nps = None
+    for count in counts:
+        with ParallelSearch(count) as searcher:
+            result = searcher.search(board, movetime=args.movetime)
+        base_nps = base_nps or result.nps
+        move = result.move.uci() if result.move else "-"
+        print(
+            f"workers {count:>3}  depth {result.depth:>2}  nodes {result.nodes:>10}  "
+            f"nps {result.nps:>8}  speedup {result.nps / max(base_nps, 1):5.2f}  "
+            f"best {move} ({result.score})"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
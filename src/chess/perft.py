@@ -0,0 +1,141 @@
+"""Perft: move generator node counts, speed and correctness check
+
+Counts leaf nodes of the legal move tree and compares them with published
+reference values. Used as the regression gate for `board` and `pieces`.
+
+Usage: python -m chess.perft [-d DEPTH] [--divide] [--fen FEN] [POSITION ...]
+"""
+
+__all__ = ["POSITIONS", "perft", "divide", "run"]
+
+import argparse
+import sys
+import time
+from typing import Callable
+
+from .board import Board, START_FEN
+from .move import Move
+from . import movegen
+
+# Name: (FEN, node counts for depth 1, 2, ...)
+# https://www.chessprogramming.org/Perft_Results
+POSITIONS: dict[str, tuple[str, tuple[int, ...]]] = {
+    "start": (START_FEN, (20, 400, 8902, 197281, 4865609)),
+    "kiwipete": (
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        (48, 2039, 97862, 4085603),
+    ),
+    "endgame": (
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        (14, 191, 2812, 43238, 674624),
+    ),
+    "promotions": (
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        (6, 264, 9467, 422333),
+    ),
+    "talkchess": (
+        "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        (44, 1486, 62379, 2103487),
+    ),
+    "middlegame": (
+        "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        (46, 2079, 89890, 3894594),
+    ),
+}
+
+DEFAULT_DEPTH = 3
+
+
+def perft(board: Board, depth: int) -> int:
+    """Returns number of leaf nodes `depth` plies deep"""
+    if depth <= 0:
+        return 1
+    moves = list(movegen.legal_moves(board))
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def divide(board: Board, depth: int) -> dict[Move, int]:
+    """Returns leaf node count below every legal root move"""
+    result = {}
+    for move in board.legal_moves():
+        board.make_move(move)
+        result[move] = perft(board, depth - 1)
+        board.unmake_move()
+    return result
+
+
+def run(
+    name: str,
+    fen: str,
+    depth: int,
+    expected: int | None = None,
+    show_divide: bool = False,
+    out: Callable[[str], None] = print,
+) -> bool:
+    """Run perft on position and report nodes, time and speed.
+    Returns False if node count differs from `expected`"""
+    board = Board.from_fen(fen)
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(board, depth)
+        for move, count in sorted(counts.items(), key=lambda item: item[0].uci()):
+            out(f"  {move.uci()}: {count}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(board, depth)
+    elapsed = time.perf_counter() - start
+
+    nps = nodes / elapsed if elapsed > 0 else 0
+    ok = expected is None or nodes == expected
+    status = "" if expected is None else ("OK" if ok else f"FAIL expected {expected}")
+    out(
+        f"{name:<12} depth {depth}  nodes {nodes:>10}  "
+        f"time {elapsed:8.3f}s  nps {nps:>10.0f}  {status}"
+    )
+    return ok
+
+
+def main(argv: list[str] | None = None) -> int:
+    """main"""
+    parser = argparse.ArgumentParser(
+        prog="python -m chess.perft", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("positions", nargs="*", help=f"one of {', '.join(POSITIONS)}")
+    parser.add_argument("-d", "--depth", type=int, default=DEFAULT_DEPTH)
+    parser.add_argument("--fen", help="run on custom position, no reference check")
+    parser.add_argument("--divide", action="store_true", help="print per-move counts")
+    args = parser.parse_args(argv)
+    if args.depth < 1:
+        parser.error("depth must be at least 1")
+
+    if args.fen:
+        run("fen", args.fen, args.depth, show_divide=args.divide)
+        return 0
+
+    names = args.positions or list(POSITIONS)
+    for name in names:
+        if name not in POSITIONS:
+            parser.error(f"unknown position {name!r}")
+    deepest = max(len(POSITIONS[name][1]) for name in names)
+    if args.depth > deepest:
+        parser.error(f"no reference values beyond depth {deepest}")
+    ok = True
+    for name in names:
+        fen, counts = POSITIONS[name]
+        if args.depth > len(counts):
+            print(f"{name:<12} no reference value for depth {args.depth}, skipped")
+            continue
+        expected = counts[args.depth - 1]
+        ok &= run(name, fen, args.depth, expected, args.divide)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
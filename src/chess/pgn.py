@@ -0,0 +1,369 @@
+"""PGN game files and SAN move notation
+
+Games are streamed from the file one at a time, so archives of any size
+are read in constant memory. With `headers_only` movetext is skipped
+without being parsed, which is much faster when only tags are needed.
+
+Usage: python -m chess.pgn FILE [--headers-only]
+Reads every game of the file and reports games per second.
+"""
+
+__all__ = ["Game", "san", "parse_san", "read_games", "game_to_pgn", "write_game"]
+
+import argparse
+import re
+import sys
+import time
+from typing import Iterator, TextIO
+
+from .utils import *
+from .bitboard import *
+from .board import Board, START_FEN, PIECE_KINDS
+from .attacks import *
+from .move import *
+from . import movegen
+
+# Seven tag roster, written first and in this order
+ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+LINE_LENGTH = 79
+
+FILE_MASKS = {
+    file: sum(1 << (row * 8 + col) for row in range(8))
+    for col, file in enumerate("abcdefgh")
+}
+RANK_MASKS = {
+    str(8 - row): sum(1 << (row * 8 + col) for col in range(8)) for row in range(8)
+}
+
+SAN_RE = re.compile(r"([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?")
+TAG_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# Comments, variation brackets, NAGs, move numbers, results and moves
+TOKEN_RE = re.compile(
+    r"\{[^}]*\}|;[^\n]*|[()]|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.*|[^\s(){};$]+"
+)
+
+
+def _piece_attacks(kind: int, sq: int, occupied: int) -> int:
+    """Returns attacks of a piece other than pawn standing on `sq`"""
+    if kind == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    if kind == BISHOP:
+        return bishop_attacks(sq, occupied)
+    if kind == ROOK:
+        return rook_attacks(sq, occupied)
+    if kind == QUEEN:
+        return queen_attacks(sq, occupied)
+    return KING_ATTACKS[sq]
+
+
+class Game:
+    """Game record: tags, moves from the start position and result.
+    `error`: Why reading movetext stopped early, None if all of it was read
+    """
+
+    def __init__(
+        self,
+        headers: dict[str, str] | None = None,
+        moves: list[Move] | None = None,
+        result: str = "*",
+    ) -> None:
+        self.headers = headers if headers is not None else {}
+        self.moves = moves if moves is not None else []
+        self.result = self.headers.get("Result", result)
+        self.error: str | None = None
+
+    @classmethod
+    def from_board(cls, board: Board, headers: dict[str, str] | None = None) -> "Game":
+        """Returns game of the moves played on board with `make_move`"""
+        moves = [record[0] for record in board.history]
+        for _ in moves:
+            board.unmake_move()
+        fen = board.to_fen()
+        for move in moves:
+            board.make_move(move)
+
+        headers = dict(headers or {})
+        if fen != START_FEN:
+            headers["SetUp"] = "1"
+            headers["FEN"] = fen
+        result = "*"
+        if not any(movegen.legal_moves(board)):
+            # Mate wins for the side giving check, stalemate is a draw
+            if board.check is None:
+                result = "1/2-1/2"
+            else:
+                result = "1-0" if board.check == Color.WHITE else "0-1"
+        headers.setdefault("Result", result)
+        return cls(headers, moves)
+
+    def __repr__(self) -> str:
+        white = self.headers.get("White", "?")
+        black = self.headers.get("Black", "?")
+        return f"<Game {white} - {black} {self.result}, {len(self.moves)} moves>"
+
+    def board(self, ply: int | None = None) -> Board:
+        """Returns position after `ply` half-moves, the final one by default"""
+        board = Board(self.headers.get("FEN", START_FEN))
+        for move in self.moves[:ply]:
+            board.make_move(move)
+        return board
+
+
+def san(board: Board, move: Move) -> str:
+    """Returns standard algebraic notation of a legal move, like `Nbd7+`"""
+    from_sq, to_sq, promotion, flags = move
+    if flags & CASTLE:
+        text = "O-O" if to_sq > from_sq else "O-O-O"
+    else:
+        color = board.color
+        kind = PIECE_KINDS[type(board.squares[from_sq])]
+        target = SQUARE_NAMES[to_sq]
+        if kind == PAWN:
+            text = (
+                SQUARE_NAMES[from_sq][0] + "x" + target if flags & CAPTURE else target
+            )
+            if promotion is not None:
+                text += "=" + promotion
+        else:
+            # Other pieces of the same type that can legally go to the target
+            others = _piece_attacks(kind, to_sq, board.occupied())
+            others &= board.pieces_bb(color, kind) & ~(1 << from_sq)
+            rivals = [
+                rival.from_sq
+                for rival in movegen.legal_moves(
+                    board,
+                    [Move(sq, to_sq, None, flags) for sq in iter_squares(others)],
+                )
+            ]
+            name = SQUARE_NAMES[from_sq]
+            prefix = PIECE_CHARS[kind]
+            if rivals:
+                if all(SQUARE_NAMES[sq][0] != name[0] for sq in rivals):
+                    prefix += name[0]
+                elif all(SQUARE_NAMES[sq][1] != name[1] for sq in rivals):
+                    prefix += name[1]
+                else:
+                    prefix += name
+            text = prefix + ("x" if flags & CAPTURE else "") + target
+
+    board.make_move(move)
+    if board.check is not None:
+        text += "+" if any(movegen.legal_moves(board)) else "#"
+    board.unmake_move()
+    return text
+
+
+def _san_candidates(board: Board, text: str) -> list[Move]:
+    """Returns pseudo-legal moves matching SAN, raises ValueError if malformed"""
+    notation = text.rstrip("+#!?")
+    color = board.color
+    if notation in ("O-O", "O-O-O", "0-0", "0-0-0"):
+        kings = board.pieces_bb(color, KING)
+        long = len(notation) == 5
+        candidates = [
+            move
+            for move in movegen.pseudo_legal_moves(board, kings)
+            if move.flags & CASTLE and (move.to_sq < move.from_sq) == long
+        ]
+    else:
+        match = SAN_RE.fullmatch(notation)
+        if match is None:
+            raise ValueError(f"Invalid SAN: {text!r}")
+        piece_char, file, rank, target, promotion = match.groups()
+        to_sq = parse_square(target)
+        sources = ~0
+        if file:
+            sources &= FILE_MASKS[file]
+        if rank:
+            sources &= RANK_MASKS[rank]
+
+        if piece_char is None:
+            # Pawn pushes come from the target file, captures name their file
+            if file is None:
+                sources &= FILE_MASKS[target[0]]
+            sources &= board.pieces_bb(color, PAWN)
+            candidates = [
+                move
+                for move in movegen.pseudo_legal_moves(board, sources)
+                if move.to_sq == to_sq and move.promotion == promotion
+            ]
+        else:
+            if promotion is not None:
+                raise ValueError(f"Invalid SAN: {text!r}")
+            kind = PIECE_CHARS.index(piece_char)
+            sources &= _piece_attacks(kind, to_sq, board.occupied())
+            sources &= board.pieces_bb(color, kind)
+            target_piece = board.squares[to_sq]
+            if target_piece is not None and target_piece.color == color:
+                sources = 0
+            flags = CAPTURE if target_piece is not None else 0
+            candidates = [Move(sq, to_sq, None, flags) for sq in iter_squares(sources)]
+    return candidates
+
+
+def parse_san(board: Board, text: str) -> Move:
+    """Returns legal move written in standard algebraic notation.
+    Raises ValueError if the move is malformed, illegal or ambiguous"""
+    legal = list(movegen.legal_moves(board, _san_candidates(board, text)))
+    if len(legal) != 1:
+        reason = "Ambiguous" if legal else "Illegal"
+        raise ValueError(f"{reason} move: {text!r}")
+    return legal[0]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _unescape(value: str) -> str:
+    return value.replace('\\"', '"').replace("\\\\", "\\")
+
+
+def _parse_movetext(game: Game, text: str) -> None:
+    """Replay movetext on the start position, skipping comments and variations"""
+    try:
+        board = game.board(0)
+    except ValueError as e:
+        game.error = str(e)
+        return
+    depth = 0
+    for token in TOKEN_RE.findall(text):
+        first = token[0]
+        if first in "{;$":
+            continue
+        if first == "(":
+            depth += 1
+            continue
+        if first == ")":
+            depth -= 1
+            continue
+        if depth:
+            continue
+        if token in RESULTS:
+            game.result = token
+            continue
+        if first.isdigit():
+            continue
+        try:
+            candidates = _san_candidates(board, token)
+            if len(candidates) == 1:
+                # Usual case: play the only candidate and check legality once
+                move = candidates[0]
+                color = board.color
+                board.make_move(move)
+                if board.king_attacked(color):
+                    board.unmake_move()
+                    raise ValueError(f"Illegal move: {token!r}")
+            else:
+                move = parse_san(board, token)
+                board.make_move(move)
+        except ValueError as e:
+            game.error = f"{e} at ply {len(game.moves) + 1}"
+            return
+        game.moves.append(move)
+
+
+def _finish(headers: dict[str, str], movetext: list[str], headers_only: bool) -> Game:
+    game = Game(headers)
+    if not headers_only:
+        _parse_movetext(game, "".join(movetext))
+    return game
+
+
+def read_games(stream: TextIO, headers_only: bool = False) -> Iterator[Game]:
+    """Yields games of a PGN stream one by one.
+    `headers_only`: Skip movetext, games have tags and result only
+    """
+    headers: dict[str, str] = {}
+    movetext: list[str] = []
+    in_moves = False
+    # Open `{` comments, a `[` inside one does not start a new game
+    in_comment = 0
+    for line in stream:
+        first = line[:1]
+        if in_comment or (first != "[" and "{" in line):
+            in_comment += line.count("{") - line.count("}")
+            if not headers_only:
+                movetext.append(line)
+            in_moves = True
+            continue
+        if first == "[":
+            if in_moves:
+                yield _finish(headers, movetext, headers_only)
+                headers, movetext, in_moves = {}, [], False
+            if match := TAG_RE.match(line):
+                headers[match[1]] = _unescape(match[2])
+        elif first == "%" or not line.strip():
+            continue
+        else:
+            in_moves = True
+            if not headers_only:
+                movetext.append(line)
+    if headers or movetext:
+        yield _finish(headers, movetext, headers_only)
+
+
+def game_to_pgn(game: Game) -> str:
+    """Returns game as PGN text: tags, empty line, movetext wrapped to 79 columns"""
+    headers = {tag: "?" for tag in ROSTER}
+    headers.update(game.headers)
+    headers["Result"] = game.result
+    tags = [f'[{tag} "{_escape(value)}"]' for tag, value in headers.items()]
+
+    board = game.board(0)
+    tokens = []
+    for move in game.moves:
+        if board.color == Color.WHITE:
+            tokens.append(f"{board.fullmove}.")
+        elif not tokens:
+            tokens.append(f"{board.fullmove}...")
+        tokens.append(san(board, move))
+        board.make_move(move)
+    tokens.append(game.result)
+
+    lines = []
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(tags) + "\n\n" + "\n".join(lines) + "\n"
+
+
+def write_game(stream: TextIO, game: Game) -> None:
+    """Append game to a PGN stream, followed by an empty line"""
+    stream.write(game_to_pgn(game) + "\n")
+
+
+def main(argv: list[str] | None = None) -> int:
+    """main"""
+    parser = argparse.ArgumentParser(
+        prog="python -m chess.pgn", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("file", help="PGN file")
+    parser.add_argument("--headers-only", action="store_true", help="skip movetext")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    games = moves = errors = 0
+    with open(args.file, encoding="utf-8", errors="replace") as stream:
+        for game in read_games(stream, args.headers_only):
+            games += 1
+            moves += len(game.moves)
+            if game.error is not None:
+                errors += 1
+                print(f"game {games}: {game.error}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{games} games, {moves} moves, {errors} errors in {elapsed:.2f}s, "
+        f"{games / max(elapsed, 1e-9):.0f} games/s"
+    )
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,8 @@ from ..utils import *
 class Bishop(Piece):
     """Bishop"""
 
+    __slots__ = ()
+
     def char(self) -> str:
         return "B"
 
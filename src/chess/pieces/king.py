@@ -5,6 +5,8 @@ from ..utils import *
 class King(Piece):
     """King"""
 
+    __slots__ = ()
+
     def char(self) -> str:
         return "K"
 
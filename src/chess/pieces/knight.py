@@ -4,6 +4,8 @@ from . import Piece
 class Knight(Piece):
     """Knight"""
 
+    __slots__ = ()
+
     def char(self) -> str:
         return "N"
 
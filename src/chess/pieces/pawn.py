@@ -5,6 +5,8 @@ from ..utils import *
 class Pawn(Piece):
     """Pawn"""
 
+    __slots__ = ()
+
     def get_color(self) -> Color:
         return self.color
 
@@ -33,7 +35,7 @@ class Pawn(Piece):
         if (
             row == start_row
             and row + 2 * direction == row1
-            and board.field[row + direction][col] is None
+            and board.get_piece(row + direction, col) is None
         ):
             return True
         return False
@@ -3,11 +3,34 @@ from ..utils import *
 from .. import board
 
 class Piece:
-    """Abstract Piece"""
+    """Abstract Piece.
+    Pieces are immutable and shared: the constructor returns the one
+    instance of the class and color, position state lives in the board"""
 
-    def __init__(self, color: Color):
-        self.color = color
-        self._moved = False
+    __slots__ = ("color",)
+
+    # Instance of every (class, color)
+    _instances: dict[tuple[type, Color], Piece] = {}
+
+    def __new__(cls, color: Color) -> Piece:
+        piece = Piece._instances.get((cls, color))
+        if piece is None:
+            piece = super().__new__(cls)
+            object.__setattr__(piece, "color", color)
+            Piece._instances[cls, color] = piece
+        return piece
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self) -> tuple:
+        return type(self), (self.color,)
+
+    def __copy__(self) -> Piece:
+        return self
+
+    def __deepcopy__(self, memo: dict) -> Piece:
+        return self
 
     def get_color(self) -> Color:
         """Returns piece color"""
@@ -48,9 +71,3 @@ class Piece:
             if piece.get_color() == self.color and team_check:
                 return False
         return True
-
-    def set_moved(self):
-        self._moved = True
-
-    def moved(self):
-        return self._moved
@@ -5,6 +5,8 @@ from ..utils import *
 class Queen(Piece):
     """Queen"""
 
+    __slots__ = ()
+
     def char(self) -> str:
         return "Q"
 
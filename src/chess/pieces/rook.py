@@ -5,6 +5,8 @@ from ..utils import *
 class Rook(Piece):
     """Rook"""
 
+    __slots__ = ()
+
     def get_color(self) -> Color:
         return self.color
 
@@ -0,0 +1,309 @@
+"""Endgame tablebases
+
+A table holds the exact result of every position of one material
+signature, like `KQvK` (white pieces, `v`, black pieces), as distance to
+mate. Tables are made by `chess.tbgen` and read through `mmap`; values
+are stored in zlib-compressed blocks, and recently used blocks are kept
+decompressed in an LRU cache, so a probe is usually one index computation
+and one dictionary lookup.
+
+Positions are indexed by side to move and the squares of the pieces in
+signature order. The first white king is moved by board symmetry into the
+a1-d1-d4 triangle (10 squares), or onto files a-d if there are pawns.
+Castling is never possible in a table position; positions with an en
+passant square are not probed.
+
+File layout, little-endian:
+    header        magic, signature, entries, block size, blocks, CRC32
+    offsets       (blocks + 1) 64-bit offsets of the blocks in the file
+    blocks        zlib-compressed value bytes
+The CRC32 covers everything after the header.
+
+Value byte: 0 draw, 255 not a legal position, otherwise plies to mate + 1.
+The side to move wins if the number of plies is odd.
+"""
+
+__all__ = ["Tablebase", "open_tablebase", "signature", "DRAW", "INVALID"]
+
+import mmap
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from .bitboard import *
+
+if TYPE_CHECKING:
+    from .board import Board
+
+DEFAULT_DIR = "tablebases"
+EXTENSION = ".ptb"
+MAGIC = b"PYCHTB1\0"
+HEADER = struct.Struct("<8s16sQIII")
+OFFSET = struct.Struct("<Q")
+BLOCK_SIZE = 1 << 16
+CACHE_BLOCKS = 256
+
+DRAW = 0
+INVALID = 255
+
+# Order of pieces in signatures, strongest first
+SIGNATURE_ORDER = "KQRBNP"
+
+
+def _transforms() -> list[list[int]]:
+    """Returns the 8 board symmetries as square maps"""
+    result = []
+    for swap in (False, True):
+        for flip_row in (False, True):
+            for flip_col in (False, True):
+                table = []
+                for sq in range(64):
+                    row, col = row_col(sq)
+                    if swap:
+                        row, col = col, row
+                    if flip_row:
+                        row = 7 - row
+                    if flip_col:
+                        col = 7 - col
+                    table.append(square(row, col))
+                result.append(table)
+    return result
+
+
+# TRANSFORMS[0] is identity, TRANSFORMS[1] mirrors files
+TRANSFORMS = _transforms()
+# a1-d1-d4 triangle, row 7 is rank 1
+TRIANGLE = [square(row, col) for row in range(7, 3, -1) for col in range(7 - row, 4)]
+LEFT_HALF = [sq for sq in range(64) if sq & 7 < 4]
+
+
+def _region_tables(
+    region: list[int], transforms: list[int]
+) -> tuple[list[int], dict[int, int]]:
+    """Returns (transform, region index) of the king by square"""
+    index = {sq: i for i, sq in enumerate(region)}
+    transform_of = []
+    for sq in range(64):
+        t = next(t for t in transforms if TRANSFORMS[t][sq] in index)
+        transform_of.append(t)
+    return transform_of, index
+
+
+PAWNLESS = _region_tables(TRIANGLE, list(range(8)))
+WITH_PAWNS = _region_tables(LEFT_HALF, [0, 1])
+
+
+def signature(board: "Board", swap: bool = False) -> str:
+    """Returns material signature like `KRvK`, black pieces first if `swap`"""
+    parts = []
+    for color_index in (1, 0) if swap else (0, 1):
+        base = color_index * 6
+        parts.append(
+            "".join(
+                char * board.bitboards[base + PIECE_CHARS.index(char)].bit_count()
+                for char in SIGNATURE_ORDER
+            )
+        )
+    return "v".join(parts)
+
+
+def table_layout(sig: str) -> tuple[list[tuple[int, int]], bool]:
+    """Returns pieces of signature as (color index, kind) in index order,
+    and whether the table has pawns"""
+    white, black = sig.split("v")
+    pieces = [(0, PIECE_CHARS.index(char)) for char in white]
+    pieces += [(1, PIECE_CHARS.index(char)) for char in black]
+    return pieces, "P" in sig
+
+
+def table_entries(sig: str) -> int:
+    """Returns number of entries of signature table"""
+    pieces, pawns = table_layout(sig)
+    region = len(LEFT_HALF if pawns else TRIANGLE)
+    return 2 * region * 64 ** (len(pieces) - 1)
+
+
+def encode_index(squares: list[int], side: int, pawns: bool) -> int:
+    """Returns table index of piece squares in signature order.
+    `side`: 0 if white is to move, 1 if black
+    """
+    transform_of, region_index = WITH_PAWNS if pawns else PAWNLESS
+    transform = TRANSFORMS[transform_of[squares[0]]]
+    index = side * len(region_index) + region_index[transform[squares[0]]]
+    for sq in squares[1:]:
+        index = index * 64 + transform[sq]
+    return index
+
+
+def decode_index(index: int, count: int, pawns: bool) -> tuple[list[int], int]:
+    """Returns (piece squares, side to move) of table index"""
+    region = LEFT_HALF if pawns else TRIANGLE
+    squares = []
+    for _ in range(count - 1):
+        index, sq = divmod(index, 64)
+        squares.append(sq)
+    side, king = divmod(index, len(region))
+    squares.append(region[king])
+    squares.reverse()
+    return squares, side
+
+
+def write_table(path: str, sig: str, values: bytes) -> None:
+    """Write table file of value bytes in index order"""
+    blocks = [
+        zlib.compress(values[start : start + BLOCK_SIZE], 9)
+        for start in range(0, len(values), BLOCK_SIZE)
+    ]
+    header_size = HEADER.size + (len(blocks) + 1) * OFFSET.size
+    offsets = [header_size]
+    for block in blocks:
+        offsets.append(offsets[-1] + len(block))
+    body = b"".join(OFFSET.pack(offset) for offset in offsets) + b"".join(blocks)
+    header = HEADER.pack(
+        MAGIC,
+        sig.encode(),
+        len(values),
+        BLOCK_SIZE,
+        len(blocks),
+        zlib.crc32(body),
+    )
+    with open(path, "wb") as f:
+        f.write(header + body)
+
+
+class Table:
+    """One memory-mapped table file"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, sig, self.entries, self.block_size, self.blocks, self.crc = (
+            HEADER.unpack_from(self.data)
+        )
+        if magic != MAGIC:
+            raise ValueError(f"Not a tablebase file: {path}")
+        self.signature = sig.rstrip(b"\0").decode()
+        self.pieces, self.pawns = table_layout(self.signature)
+        if self.entries != table_entries(self.signature):
+            raise ValueError(f"Wrong table size: {path}")
+
+    def verify(self) -> bool:
+        """Check file contents against the checksum"""
+        return zlib.crc32(self.data[HEADER.size :]) == self.crc
+
+    def block(self, number: int) -> bytes:
+        """Returns decompressed block"""
+        start, end = struct.unpack_from(
+            "<QQ", self.data, HEADER.size + number * OFFSET.size
+        )
+        return zlib.decompress(self.data[start:end])
+
+    def close(self) -> None:
+        self.data.close()
+        self.file.close()
+
+
+class Tablebase:
+    """Tables of a directory, opened on first use"""
+
+    def __init__(self, directory: str = DEFAULT_DIR, cache_blocks: int = CACHE_BLOCKS):
+        """`directory`: Folder with `.ptb` files named by signature, like `KQvK.ptb`
+        `cache_blocks`: Number of decompressed blocks kept in memory
+        """
+        self.directory = directory
+        self.cache_blocks = cache_blocks
+        # Signature -> table, None if there is no file
+        self.tables: dict[str, Table | None] = {}
+        # (signature, block number) -> values, least recently used first
+        self.cache: OrderedDict[tuple[str, int], bytes] = OrderedDict()
+        self.max_pieces = 0
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith(EXTENSION):
+                    pieces = len(name) - len(EXTENSION) - 1
+                    self.max_pieces = max(self.max_pieces, pieces)
+
+    def _table(self, sig: str) -> Table | None:
+        if sig not in self.tables:
+            path = os.path.join(self.directory, sig + EXTENSION)
+            self.tables[sig] = Table(path) if os.path.exists(path) else None
+        return self.tables[sig]
+
+    def _value(self, table: Table, index: int) -> int:
+        number, offset = divmod(index, table.block_size)
+        key = (table.signature, number)
+        cache = self.cache
+        values = cache.get(key)
+        if values is None:
+            values = table.block(number)
+            cache[key] = values
+            if len(cache) > self.cache_blocks:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return values[offset]
+
+    def probe(self, board: "Board") -> tuple[int, int] | None:
+        """Returns (result, plies) of the position or None if not in the tables.
+        `result`: 1 if the side to move wins, 0 draw, -1 loss
+        `plies`: Half-moves to mate with best play, 0 for a draw"""
+        occupied = board.occupancy[0] | board.occupancy[1]
+        if occupied.bit_count() > self.max_pieces or board.castling:
+            return None
+        if board.ep is not None:
+            return None
+        for swap in (False, True):
+            table = self._table(signature(board, swap))
+            if table is not None:
+                break
+        else:
+            return None
+
+        bitboards = board.bitboards
+        squares = []
+        seen = set()
+        for color_index, kind in table.pieces:
+            if swap:
+                color_index = 1 - color_index
+            index = color_index * 6 + kind
+            if index in seen:
+                continue
+            seen.add(index)
+            for sq in iter_squares(bitboards[index]):
+                # Colors swapped: board mirrored top to bottom
+                squares.append(sq ^ 56 if swap else sq)
+        side = board.color.index ^ swap
+        value = self._value(table, encode_index(squares, side, table.pawns))
+        if value == DRAW:
+            return 0, 0
+        if value == INVALID:
+            return None
+        plies = value - 1
+        return (1 if plies & 1 else -1), plies
+
+    def probe_wdl(self, board: "Board") -> int | None:
+        """Returns 1 for a win of the side to move, 0 draw, -1 loss or None"""
+        result = self.probe(board)
+        return result[0] if result is not None else None
+
+    def close(self) -> None:
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables.clear()
+        self.cache.clear()
+
+    def __enter__(self) -> "Tablebase":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def open_tablebase(directory: str = DEFAULT_DIR) -> Tablebase | None:
+    """Returns tablebase of directory or None if it has no tables"""
+    tablebase = Tablebase(directory)
+    return tablebase if tablebase.max_pieces else None
@@ -0,0 +1,410 @@
+"""Endgame tablebase generator
+
+Tables are made by retrograde analysis over the positions of a table
+index (see `chess.tablebase`):
+
+1. Every index is decoded and its legal moves are generated with the
+   board rules. Mates are lost in 0 plies; captures and promotions leave
+   the table and are looked up in the smaller tables, which are made
+   first. The other moves are counted.
+2. Positions resolved at `n` plies are unmade: for every predecessor a
+   loss in `n` is a win in `n + 1`, and a win in `n` takes one from the
+   predecessor's count of unrefuted moves. A predecessor without such
+   moves left is lost.
+3. Positions never resolved are draws.
+
+Both passes are split into chunks of indices handled by a process pool.
+Tables with pawns of both colors are not supported, as en passant
+captures are not part of the index.
+
+Usage: python -m chess.tbgen [SIGNATURE ...] [-d DIR] [-w WORKERS]
+Makes the tables of the signatures, like `KBNvK`, and the tables they
+depend on. By default makes KQvK, KRvK and KPvK.
+"""
+
+__all__ = ["generate", "generate_all", "normalize", "children", "DEFAULT_SIGNATURES"]
+
+import argparse
+import itertools
+import os
+import re
+import sys
+import time
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from .utils import Color
+from .bitboard import *
+from .attacks import *
+from .board import Board, PIECES
+from .move import CAPTURE
+from .tablebase import *
+from .tablebase import (
+    DEFAULT_DIR,
+    EXTENSION,
+    SIGNATURE_ORDER,
+    TRANSFORMS,
+    WITH_PAWNS,
+    PAWNLESS,
+    Table,
+    decode_index,
+    encode_index,
+    table_entries,
+    table_layout,
+    write_table,
+)
+from . import movegen
+
+DEFAULT_SIGNATURES = ("KQvK", "KRvK", "KPvK")
+MAX_PIECES = 4
+# Indices per task of the first pass, resolved positions per task of the next
+CHUNK = 4096
+UNMOVE_CHUNK = 1024
+MAX_PLIES = INVALID - 2
+
+SIGNATURE_RE = re.compile(r"K[QRBNP]*vK[QRBNP]*")
+
+_worker_signature: str | None = None
+_worker_tablebase: Tablebase | None = None
+
+
+def _side(pieces: str) -> str:
+    """Returns side of signature with pieces in signature order"""
+    return "".join(sorted(pieces, key=SIGNATURE_ORDER.index))
+
+
+def normalize(sig: str) -> str:
+    """Returns signature with the stronger side first, as tables are named.
+    Raises ValueError if malformed"""
+    if SIGNATURE_RE.fullmatch(sig) is None:
+        raise ValueError(f"Invalid signature: {sig!r}")
+    white, black = (_side(side) for side in sig.split("v"))
+
+    def strength(side: str) -> tuple:
+        return len(side), [-SIGNATURE_ORDER.index(char) for char in side]
+
+    if strength(black) > strength(white):
+        white, black = black, white
+    return f"{white}v{black}"
+
+
+def children(sig: str) -> set[str]:
+    """Returns signatures reached from table by a capture or a promotion"""
+    sides = sig.split("v")
+    result = set()
+    for index, side in enumerate(sides):
+        other = sides[1 - index]
+        for char in set(side[1:]):
+            rest = side.replace(char, "", 1)
+            new_sides = [rest]
+            if char == "P":
+                new_sides += [rest + promoted for promoted in "QRBN"]
+            for new_side in new_sides:
+                pair = (new_side, other) if index == 0 else (other, new_side)
+                result.add(normalize("v".join(pair)))
+    return result
+
+
+def _check(sig: str) -> None:
+    if sig != normalize(sig):
+        raise ValueError(f"Signature not normalized: {sig!r}, use {normalize(sig)!r}")
+    if len(sig) - 1 > MAX_PIECES:
+        raise ValueError(f"At most {MAX_PIECES} pieces: {sig!r}")
+    white, black = sig.split("v")
+    if "P" in white and "P" in black:
+        raise ValueError(f"Pawns of both colors are not supported: {sig!r}")
+
+
+def _valid(squares: list[int], pieces: list[tuple[int, int]]) -> bool:
+    """Quick check of piece placement without the board"""
+    if len(set(squares)) != len(squares):
+        return False
+    for sq, (_, kind) in zip(squares, pieces):
+        if kind == PAWN and sq >> 3 in (0, 7):
+            return False
+    # White king is first and black king is right after the white pieces
+    black_king = squares[[color for color, _ in pieces].index(1)]
+    return not KING_ATTACKS[squares[0]] >> black_king & 1
+
+
+def _setup(
+    board: Board, squares: list[int], side: int, pieces: list[tuple[int, int]]
+) -> None:
+    board._clear()
+    for sq, (color_index, kind) in zip(squares, pieces):
+        board._put(sq, PIECES[color_index * 6 + kind])
+    board.color = Color.WHITE if side == 0 else Color.BLACK
+    board.castling = 0
+    board.ep = None
+    board.history = []
+
+
+def _worker_tables(sig: str, directory: str) -> Tablebase:
+    """Returns tables of the worker, reopened for every new signature
+    as smaller tables are written in between"""
+    global _worker_signature, _worker_tablebase
+    if _worker_signature != sig:
+        if _worker_tablebase is not None:
+            _worker_tablebase.close()
+        _worker_tablebase = Tablebase(directory)
+        _worker_signature = sig
+    return _worker_tablebase
+
+
+def _initial(
+    sig: str, directory: str, start: int, stop: int
+) -> tuple[int, bytes, bytes, list[tuple[int, int, int]]]:
+    """First pass over indices `start` to `stop`.
+    Returns (start, values, move counts, conversions), values are INVALID,
+    1 for mate or 0; conversions are (index, plies to win, plies to lose)
+    of positions with captures or promotions, 0 if there is none"""
+    tablebase = _worker_tables(sig, directory)
+    pieces, pawns = table_layout(sig)
+    values = bytearray(stop - start)
+    counts = array("H", bytes(2 * (stop - start)))
+    conversions = []
+    board = Board()
+    for index in range(start, stop):
+        squares, side = decode_index(index, len(pieces), pawns)
+        offset = index - start
+        if not _valid(squares, pieces):
+            values[offset] = INVALID
+            continue
+        _setup(board, squares, side, pieces)
+        color = board.color
+        if board.king_attacked(color.opponent()):
+            values[offset] = INVALID
+            continue
+
+        count = has_moves = 0
+        win = lose = 0
+        escape = False
+        for move in movegen.legal_moves(board):
+            has_moves = 1
+            if not (move.flags & CAPTURE or move.promotion):
+                count += 1
+                continue
+            board.make_move(move)
+            found = tablebase.probe(board)
+            board.unmake_move()
+            if found is None:
+                raise RuntimeError(f"Missing table of {signature(board)}")
+            result, plies = found
+            if result < 0:
+                win = min(win or plies + 1, plies + 1)
+            elif result > 0:
+                lose = max(lose, plies + 1)
+            else:
+                escape = True
+        if not has_moves:
+            # Mate, or a stalemate left as a draw
+            values[offset] = 1 if board.king_attacked(color) else 0
+            continue
+        # A drawn or won conversion: the position is never lost
+        counts[offset] = count + (escape or bool(win))
+        if win or lose:
+            conversions.append((index, win, lose))
+    return start, bytes(values), counts.tobytes(), conversions
+
+
+def _unmoves(
+    squares: tuple[int, ...], mover: int, pieces: list[tuple[int, int]]
+) -> list[list[int]]:
+    """Returns piece squares before every move of `mover` that reaches the
+    position without a capture or promotion"""
+    occupied = 0
+    for sq in squares:
+        occupied |= 1 << sq
+    result = []
+    for i, (color_index, kind) in enumerate(pieces):
+        if color_index != mover:
+            continue
+        sq = squares[i]
+        if kind == PAWN:
+            back = 8 if mover == 0 else -8
+            before = sq + back
+            sources = 0
+            if not occupied >> before & 1 and before >> 3 not in (0, 7):
+                sources = 1 << before
+                start_row = 4 if mover == 0 else 3
+                double = before + back
+                if sq >> 3 == start_row and not occupied >> double & 1:
+                    sources |= 1 << double
+        elif kind == KNIGHT:
+            sources = KNIGHT_ATTACKS[sq]
+        elif kind == KING:
+            sources = KING_ATTACKS[sq]
+        else:
+            rest = occupied & ~(1 << sq)
+            if kind == BISHOP:
+                sources = bishop_attacks(sq, rest)
+            elif kind == ROOK:
+                sources = rook_attacks(sq, rest)
+            else:
+                sources = queen_attacks(sq, rest)
+        for from_sq in iter_squares(sources & ~occupied):
+            before_squares = list(squares)
+            before_squares[i] = from_sq
+            result.append(before_squares)
+    return result
+
+
+def _predecessors(sig: str, indices: list[int]) -> list[int]:
+    """Returns indices of the positions before resolved positions, once for
+    every move made to reach them"""
+    pieces, pawns = table_layout(sig)
+    transform_of = (WITH_PAWNS if pawns else PAWNLESS)[0]
+    result = []
+    for index in indices:
+        squares, side = decode_index(index, len(pieces), pawns)
+        mover = 1 - side
+        # (predecessor, position after the move as seen from the predecessor)
+        moves = set()
+        for t in (0, 1) if pawns else range(8):
+            transform = TRANSFORMS[t]
+            variant = tuple(transform[sq] for sq in squares)
+            for before in _unmoves(variant, mover, pieces):
+                frame = TRANSFORMS[transform_of[before[0]]]
+                after = [frame[sq] for sq in variant]
+                # Positions symmetric on a diagonal and with identical pieces
+                # swapped have more than one index, count the move once
+                if encode_index(after, side, pawns) == index:
+                    moves.add((encode_index(before, mover, pawns), tuple(after)))
+        result.extend(index for index, _ in moves)
+    return result
+
+
+def generate(
+    sig: str, directory: str = DEFAULT_DIR, executor: Executor | None = None
+) -> str:
+    """Make table of a normalized signature, returns its path.
+    Tables of captures and promotions must exist already"""
+    _check(sig)
+    if executor is None:
+        with ProcessPoolExecutor() as executor:
+            return generate(sig, directory, executor)
+
+    entries = table_entries(sig)
+    values = bytearray(entries)
+    counts = array("H", bytes(2 * entries))
+    # Plies -> positions resolved at that distance
+    pending: dict[int, list[int]] = {}
+    # Plies to lose of positions with losing captures or promotions
+    lose_at: dict[int, int] = {}
+
+    ranges = [
+        (start, min(start + CHUNK, entries)) for start in range(0, entries, CHUNK)
+    ]
+    tasks = executor.map(
+        _initial,
+        *zip(*((sig, directory, start, stop) for start, stop in ranges)),
+    )
+    for start, chunk, chunk_counts, conversions in tasks:
+        values[start : start + len(chunk)] = chunk
+        counts[start : start + len(chunk)] = array("H", chunk_counts)
+        for index, win, lose in conversions:
+            if win:
+                pending.setdefault(win, []).append(index)
+            if lose:
+                lose_at[index] = lose
+                if not counts[index]:
+                    pending.setdefault(lose, []).append(index)
+    for index, value in enumerate(values):
+        if value == 1:
+            values[index] = 0
+            pending.setdefault(0, []).append(index)
+
+    plies = 0
+    while pending:
+        resolved = []
+        for index in pending.pop(plies, []):
+            if values[index] == 0:
+                values[index] = plies + 1
+                resolved.append(index)
+        if resolved and plies >= MAX_PLIES:
+            raise RuntimeError(f"Mate too long for table {sig}")
+        chunks = [
+            resolved[start : start + UNMOVE_CHUNK]
+            for start in range(0, len(resolved), UNMOVE_CHUNK)
+        ]
+        for found in executor.map(_predecessors, itertools.repeat(sig), chunks):
+            for index in found:
+                if values[index]:
+                    continue
+                if not plies & 1:
+                    # The side to move loses after this move
+                    pending.setdefault(plies + 1, []).append(index)
+                    continue
+                counts[index] -= 1
+                if not counts[index]:
+                    lose = max(plies + 1, lose_at.get(index, 0))
+                    pending.setdefault(lose, []).append(index)
+        plies += 1
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, sig + EXTENSION)
+    write_table(path, sig, bytes(values))
+    return path
+
+
+def generate_all(
+    signatures: list[str],
+    directory: str = DEFAULT_DIR,
+    workers: int | None = None,
+    progress=None,
+) -> list[str]:
+    """Make tables of the signatures and the smaller tables they need,
+    skipping tables already in the directory. Returns paths of new tables"""
+    made = []
+    with ProcessPoolExecutor(workers) as executor:
+
+        def make(sig: str) -> None:
+            path = os.path.join(directory, sig + EXTENSION)
+            if os.path.exists(path):
+                return
+            for child in sorted(children(sig)):
+                make(child)
+            start = time.perf_counter()
+            generate(sig, directory, executor)
+            made.append(path)
+            if progress is not None:
+                elapsed = time.perf_counter() - start
+                entries = table_entries(sig)
+                print(
+                    f"{sig}: {entries} positions in {elapsed:.1f}s, "
+                    f"{entries / max(elapsed, 1e-9):.0f} positions/s",
+                    file=progress,
+                )
+
+        for sig in signatures:
+            make(normalize(sig))
+    return made
+
+
+def main(argv: list[str] | None = None) -> int:
+    """main"""
+    parser = argparse.ArgumentParser(
+        prog="python -m chess.tbgen", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("signatures", nargs="*", default=DEFAULT_SIGNATURES)
+    parser.add_argument("-d", "--directory", default=DEFAULT_DIR)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    try:
+        made = generate_all(args.signatures, args.directory, args.workers, sys.stderr)
+    except ValueError as e:
+        parser.error(str(e))
+    for path in made:
+        table = Table(path)
+        valid = table.verify()
+        table.close()
+        if not valid:
+            print(f"{path}: checksum mismatch", file=sys.stderr)
+            return 1
+    print(f"{len(made)} tables written to {args.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
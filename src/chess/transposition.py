@@ -0,0 +1,135 @@
+"""Transposition table
+
+Fixed-size table of search results in one preallocated buffer of 64-bit
+words, so memory stays flat however long the search runs.
+
+Buckets hold two entries: the first is replaced only by deeper (or newer)
+results, the second is always replaced. Every entry is two words: the key
+xor-ed with the data and the data itself, so a torn write from another
+process sharing the buffer reads as a miss instead of a wrong hit.
+
+Data word layout (low to high bits):
+    16 move code, 8 depth, 2 bound, 32 score + 2**31, 6 search age
+"""
+
+__all__ = ["EXACT", "LOWER", "UPPER", "TranspositionTable"]
+
+from array import array
+
+# Bound types
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+WORD_SIZE = 8
+ENTRY_WORDS = 2
+BUCKET_WORDS = 2 * ENTRY_WORDS
+SCORE_OFFSET = 1 << 31
+AGE_MASK = 63
+
+
+class TranspositionTable:
+    """Hash table of search results keyed by `Board.key`"""
+
+    def __init__(self, size_mb: float = 16, buffer=None) -> None:
+        """`size_mb`: Table size in megabytes, rounded down to a power of two buckets
+        `buffer`: Writable buffer to keep entries in, allocated if not given
+        """
+        if buffer is None:
+            buffer = array("Q", bytes(self.bytes_for(size_mb)))
+        self.buffer = buffer
+        self.words = memoryview(buffer).cast("B").cast("Q")
+        self.buckets = len(self.words) // BUCKET_WORDS
+        if self.buckets & (self.buckets - 1):
+            raise ValueError("Buffer must hold a power of two buckets")
+        self.mask = self.buckets - 1
+        self.age = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    @staticmethod
+    def bytes_for(size_mb: float) -> int:
+        """Returns buffer size of a table of at most `size_mb` megabytes"""
+        buckets = 1
+        while buckets * 2 * BUCKET_WORDS * WORD_SIZE <= size_mb * 2**20:
+            buckets *= 2
+        return buckets * BUCKET_WORDS * WORD_SIZE
+
+    @property
+    def size_bytes(self) -> int:
+        return self.buckets * BUCKET_WORDS * WORD_SIZE
+
+    def new_search(self) -> None:
+        """Mark entries of earlier searches as replaceable"""
+        self.age = (self.age + 1) & AGE_MASK
+
+    def release(self) -> None:
+        """Drop the view of the buffer so shared memory can be closed"""
+        self.words.release()
+
+    def clear(self) -> None:
+        self.words.cast("B")[:] = bytes(self.size_bytes)
+        self.age = 0
+
+    def probe(self, key: int) -> tuple[int, int, int, int] | None:
+        """Returns (depth, score, bound, move code) stored for key or None"""
+        words = self.words
+        index = (key & self.mask) * BUCKET_WORDS
+        occupied = False
+        for i in (index, index + ENTRY_WORDS):
+            data = words[i + 1]
+            if not data:
+                continue
+            if words[i] ^ data == key:
+                self.hits += 1
+                return (
+                    data >> 16 & 0xFF,
+                    (data >> 26 & 0xFFFFFFFF) - SCORE_OFFSET,
+                    data >> 24 & 3,
+                    data & 0xFFFF,
+                )
+            occupied = True
+        if occupied:
+            self.collisions += 1
+        self.misses += 1
+        return None
+
+    def store(self, key: int, depth: int, score: int, bound: int, move: int) -> None:
+        """Save search result; `move` is a `Move.encode` code or 0"""
+        words = self.words
+        index = (key & self.mask) * BUCKET_WORDS
+        data = (
+            move
+            | min(depth, 255) << 16
+            | bound << 24
+            | (score + SCORE_OFFSET) << 26
+            | self.age << 58
+        )
+
+        # Depth-preferred slot takes the result if it is as deep, about the
+        # same position or left by an earlier search
+        old = words[index + 1]
+        if (
+            not old
+            or words[index] ^ old == key
+            or (old >> 16 & 0xFF) <= depth
+            or old >> 58 != self.age
+        ):
+            slot = index
+        else:
+            slot = index + ENTRY_WORDS
+        words[slot] = key ^ data
+        words[slot + 1] = data
+        self.stores += 1
+
+    def usage(self) -> float:
+        """Returns share of filled entries in the first 1000 buckets, 0 to 1"""
+        words = self.words
+        sample = min(self.buckets, 1000)
+        filled = sum(
+            1 for i in range(sample * BUCKET_WORDS // ENTRY_WORDS) if words[2 * i + 1]
+        )
+        return filled / (sample * 2)
@@ -0,0 +1,266 @@
+"""UCI protocol front-end
+
+Speaks the Universal Chess Interface over stdin and stdout, so chess GUIs
+and tournament managers can run the engine. Searches run in a background
+thread: `stop` sets an event checked every few hundred nodes and the best
+move of the last completed iteration is sent right away.
+
+Supported commands: uci, isready, setoption, ucinewgame, position, go
+(depth, nodes, movetime, wtime/btime/winc/binc/movestogo, infinite, ponder),
+stop, ponderhit, quit. A `go` without limits searches to the default depth.
+
+Usage: python -m chess.uci
+"""
+
+__all__ = ["UCIEngine"]
+
+import sys
+import threading
+from typing import TextIO
+
+from .board import Board, START_FEN
+from .book import Book, open_book
+from .engine import DEFAULT_DEPTH, DEFAULT_TT_MB, MAX_PLY, SearchResult, search
+from .move import Move
+from .tablebase import Tablebase, open_tablebase, DEFAULT_DIR
+from .transposition import TranspositionTable
+
+NAME = "PyChessQT"
+AUTHOR = "virashu"
+
+# Share of the remaining time spent on one move without `movestogo`
+MOVES_TO_GO = 30
+# Kept back for the GUI and the process, seconds
+TIME_RESERVE = 0.05
+MAX_HASH_MB = 1024
+
+
+def _parse_move(board: Board, text: str) -> Move:
+    """Returns legal move in coordinate notation, raises ValueError if none"""
+    for move in board.legal_moves():
+        if move.uci() == text:
+            return move
+    raise ValueError(f"Illegal move: {text!r}")
+
+
+def _score(result: SearchResult) -> str:
+    mate = result.mate_in()
+    return f"mate {mate}" if mate is not None else f"cp {result.score}"
+
+
+class UCIEngine:
+    """State of one UCI session"""
+
+    def __init__(self, output: TextIO = sys.stdout) -> None:
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.board = Board()
+        self.hash_mb = DEFAULT_TT_MB
+        self.tt = TranspositionTable(self.hash_mb)
+        self.book: Book | None = open_book()
+        self.tablebase: Tablebase | None = open_tablebase()
+        self.thread: threading.Thread | None = None
+        self.stop_event = threading.Event()
+        # Set while the search may not send `bestmove`: pondering or infinite
+        self.hold = threading.Event()
+        self.ponder_time: float | None = None
+        self.timer: threading.Timer | None = None
+
+    def send(self, line: str) -> None:
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line: str) -> bool:
+        """Run one command, returns False on `quit`"""
+        command, *args = line.split() or [""]
+        if command == "uci":
+            self.send(f"id name {NAME}")
+            self.send(f"id author {AUTHOR}")
+            self.send(
+                f"option name Hash type spin default {DEFAULT_TT_MB} "
+                f"min 1 max {MAX_HASH_MB}"
+            )
+            self.send("option name OwnBook type check default true")
+            self.send(f"option name TablebasePath type string default {DEFAULT_DIR}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.wait()
+            self.set_option(args)
+        elif command == "ucinewgame":
+            self.wait()
+            self.tt = TranspositionTable(self.hash_mb)
+        elif command == "position":
+            self.wait()
+            self.set_position(args)
+        elif command == "go":
+            self.wait()
+            self.go(args)
+        elif command == "stop":
+            self.wait()
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "quit":
+            self.wait()
+            return False
+        return True
+
+    def set_option(self, args: list[str]) -> None:
+        text = " ".join(args)
+        name, _, value = text.removeprefix("name ").partition(" value ")
+        name = name.strip().lower()
+        value = value.strip()
+        if name == "hash":
+            try:
+                size = int(value)
+            except ValueError:
+                self.send(f"info string Invalid Hash value: {value!r}")
+                return
+            self.hash_mb = max(1, min(size, MAX_HASH_MB))
+            self.tt = TranspositionTable(self.hash_mb)
+        elif name == "ownbook":
+            if self.book is not None:
+                self.book.close()
+            self.book = open_book() if value.lower() == "true" else None
+        elif name == "tablebasepath":
+            if self.tablebase is not None:
+                self.tablebase.close()
+            self.tablebase = open_tablebase(value) if value else None
+
+    def set_position(self, args: list[str]) -> None:
+        if "moves" in args:
+            split = args.index("moves")
+            setup, moves = args[:split], args[split + 1 :]
+        else:
+            setup, moves = args, []
+        try:
+            if setup[:1] == ["fen"]:
+                board = Board(" ".join(setup[1:]))
+            else:
+                board = Board(START_FEN)
+            for text in moves:
+                board.make_move(_parse_move(board, text))
+        except (ValueError, IndexError) as e:
+            self.send(f"info string {e}")
+            return
+        self.board = board
+
+    def go(self, args: list[str]) -> None:
+        options: dict[str, int] = {}
+        flags = set()
+        for i, word in enumerate(args):
+            if word in ("infinite", "ponder"):
+                flags.add(word)
+            elif i + 1 < len(args) and args[i + 1].lstrip("-").isdigit():
+                options[word] = int(args[i + 1])
+
+        depth = options.get("depth")
+        nodes = options.get("nodes")
+        movetime = None
+        if "movetime" in options:
+            movetime = options["movetime"] / 1000
+        else:
+            white = self.board.color.index == 0
+            left = options.get("wtime" if white else "btime")
+            if left is not None:
+                increment = options.get("winc" if white else "binc", 0)
+                moves = options.get("movestogo", MOVES_TO_GO)
+                budget = left / max(moves, 1) + increment / 2
+                movetime = max(min(budget, left / 2) / 1000 - TIME_RESERVE, 0.01)
+
+        self.stop_event.clear()
+        self.hold.clear()
+        self.ponder_time = None
+        if flags:
+            # Searches until `stop`, or until the time runs out after `ponderhit`
+            self.hold.set()
+            self.ponder_time = movetime if "ponder" in flags else None
+            depth = depth or MAX_PLY
+            movetime = None
+        elif depth is None and movetime is None and nodes is None:
+            depth = DEFAULT_DEPTH
+
+        self.thread = threading.Thread(
+            target=self._search,
+            args=(depth, movetime, nodes, "ponder" not in flags),
+        )
+        self.thread.start()
+
+    def _search(
+        self, depth: int | None, movetime: float | None, nodes: int | None, book: bool
+    ) -> None:
+        result = search(
+            self.board,
+            depth,
+            movetime,
+            self.tt,
+            book=self.book if book else None,
+            tablebase=self.tablebase,
+            stop=self.stop_event,
+            info=self._info,
+            nodes=nodes,
+        )
+        # `bestmove` waits for `stop` or `ponderhit` in infinite and ponder mode
+        while self.hold.is_set() and not self.stop_event.wait(0.01):
+            pass
+        if result.move is None:
+            self.send("bestmove 0000")
+            return
+        line = f"bestmove {result.move.uci()}"
+        if len(result.pv) > 1:
+            line += f" ponder {result.pv[1].uci()}"
+        self.send(line)
+
+    def _info(self, result: SearchResult) -> None:
+        pv = " ".join(move.uci() for move in result.pv)
+        self.send(
+            f"info depth {result.depth} score {_score(result)} "
+            f"nodes {result.nodes} nps {result.nps} "
+            f"time {int(result.time * 1000)} pv {pv}"
+        )
+
+    def ponderhit(self) -> None:
+        """The expected move was played: search on under the normal time limit"""
+        self.hold.clear()
+        if self.ponder_time is not None:
+            self.timer = threading.Timer(self.ponder_time, self.stop_event.set)
+            self.timer.daemon = True
+            self.timer.start()
+        else:
+            self.stop_event.set()
+
+    def wait(self) -> None:
+        """Stop running search and wait for its `bestmove`"""
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def close(self) -> None:
+        self.wait()
+        if self.book is not None:
+            self.book.close()
+        if self.tablebase is not None:
+            self.tablebase.close()
+
+
+def main(stream: TextIO = sys.stdin) -> int:
+    """main"""
+    engine = UCIEngine()
+    try:
+        for line in stream:
+            if not engine.handle(line.strip()):
+                break
+    finally:
+        engine.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,11 @@ class Color(Enum):
     WHITE = 1
     BLACK = 2
 
+    def __init__(self, value: int) -> None:
+        # 0 for white and 1 for black, used to index per-color tables.
+        # A plain attribute, the property lookup was a hot spot
+        self.index = value - 1
+
     def opponent(self) -> "Color":
         return Color.WHITE if self == Color.BLACK else Color.BLACK
 
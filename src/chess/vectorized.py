@@ -0,0 +1,295 @@
+"""Vectorized evaluation of many positions with NumPy
+
+Positions are packed into a `(N, 12)` array of bitboards, in the order of
+`Board.bitboards`, and a `(N,)` array of sides to move. Every term of
+`chess.evaluation.evaluate_full` is computed for the whole batch at once:
+material and piece-square values are looked up per byte of every
+bitboard, mobility uses shifted bitboard fills and pawn structure uses
+file masks. Scores are equal to the scalar evaluator.
+
+Needs NumPy, which the rest of the package does not.
+
+Usage: python -m chess.vectorized FILE [--npy PREFIX] [--planes]
+Evaluates every FEN or EPD position of the file, checks the scores against
+`evaluate_full` and reports positions per microsecond.
+"""
+
+__all__ = ["to_arrays", "planes", "evaluate_batch", "save_npy"]
+
+import argparse
+import sys
+import time
+from typing import Iterable
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError(
+        "chess.vectorized needs NumPy, install the `vectorized` extra "
+        "or `pip install numpy`"
+    ) from e
+
+from .bitboard import *
+from .board import Board
+from .evaluation import *
+from .evaluation import (
+    DOUBLED_PAWN,
+    FILES,
+    ADJACENT_FILES,
+    ISOLATED_PAWN,
+    MAX_PHASE,
+    PASSED_PAWN,
+)
+
+U64 = np.uint64
+FULL = (1 << 64) - 1
+ROWS = [0xFF << (row * 8) for row in range(8)]
+NOT_A = U64(FULL ^ FILES[0])
+NOT_H = U64(FULL ^ FILES[7])
+NOT_AB = U64(FULL ^ FILES[0] ^ FILES[1])
+NOT_GH = U64(FULL ^ FILES[6] ^ FILES[7])
+# Sums of middlegame scores stay far below 2 ** 19
+EG_SHIFT = 20
+# Positions evaluated together, small enough for the arrays to stay in cache
+CHUNK = 1 << 14
+
+# (shift, left, mask): row 0 is on top, so a row up is a right shift by 8
+_ROOK_STEPS = (
+    (U64(8), False, U64(FULL)),
+    (U64(8), True, U64(FULL)),
+    (U64(1), True, NOT_A),
+    (U64(1), False, NOT_H),
+)
+_BISHOP_STEPS = (
+    (U64(7), False, NOT_A),
+    (U64(9), False, NOT_H),
+    (U64(9), True, NOT_A),
+    (U64(7), True, NOT_H),
+)
+_KNIGHT_STEPS = (
+    (U64(17), True, NOT_A),
+    (U64(15), True, NOT_H),
+    (U64(10), True, NOT_AB),
+    (U64(6), True, NOT_GH),
+    (U64(15), False, NOT_A),
+    (U64(17), False, NOT_H),
+    (U64(6), False, NOT_AB),
+    (U64(10), False, NOT_GH),
+)
+
+
+def _byte_tables(mg_tables: list[list[int]], eg_tables: list[list[int]]) -> np.ndarray:
+    """Returns sums of table values by bitboard index, byte number and byte.
+    Middlegame and endgame values are packed into one number, `mg + eg << 20`,
+    so both are summed by one lookup"""
+    bits = (np.arange(256)[:, None] >> np.arange(8) & 1).astype(np.int64)
+    values = np.array(mg_tables, dtype=np.int64) + (
+        np.array(eg_tables, dtype=np.int64) << EG_SHIFT
+    )
+    # (12, 8 bytes, 8 bits) x (256 bytes, 8 bits) -> (12, 8, 256)
+    return np.einsum("ijk,lk->ijl", values.reshape(12, 8, 8), bits)
+
+
+SCORE_BYTES = _byte_tables(MG_TABLES, EG_TABLES)
+POPCOUNT_BYTES = np.array([bin(value).count("1") for value in range(256)], np.int64)
+
+
+def _popcount(bitboards: np.ndarray) -> np.ndarray:
+    """Returns number of set bits of every bitboard"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bitboards).astype(np.int64)
+    octets = bitboards.astype("<u8").view(np.uint8)
+    return POPCOUNT_BYTES[octets].reshape(*bitboards.shape, 8).sum(axis=-1)
+
+
+def _shift(bitboards: np.ndarray, step: tuple) -> np.ndarray:
+    amount, left, mask = step
+    return ((bitboards << amount) if left else (bitboards >> amount)) & mask
+
+
+def _slide(pieces: np.ndarray, empty: np.ndarray, steps: tuple) -> np.ndarray:
+    """Returns squares attacked by all sliders of a bitboard, blockers included"""
+    attacks = np.zeros_like(pieces)
+    for step in steps:
+        fill = pieces
+        for _ in range(6):
+            fill = fill | _shift(fill, step) & empty
+        attacks |= _shift(fill, step)
+    return attacks
+
+
+def to_arrays(boards: Iterable[Board]) -> tuple[np.ndarray, np.ndarray]:
+    """Returns bitboards `(N, 12)` and sides to move `(N,)`, 0 for white"""
+    bitboards = []
+    colors = []
+    for board in boards:
+        bitboards.append(board.bitboards)
+        colors.append(board.color.index)
+    return (
+        np.array(bitboards, dtype=U64).reshape(-1, 12),
+        np.array(colors, dtype=np.uint8),
+    )
+
+
+def planes(bitboards: np.ndarray) -> np.ndarray:
+    """Returns `(N, 12, 8, 8)` array of 0 and 1, indexed by row and column"""
+    octets = np.ascontiguousarray(bitboards, dtype="<u8").view(np.uint8)
+    bits = np.unpackbits(octets.reshape(-1, 12, 8), axis=2, bitorder="little")
+    return bits.reshape(-1, 12, 8, 8)
+
+
+def _material(columns: np.ndarray) -> np.ndarray:
+    """Returns tapered material and piece-square score, positive for white"""
+    count = columns.shape[1]
+    # (12 bitboards, 8 bytes, N) so that every lookup reads contiguous bytes
+    octets = columns.view(np.uint8).reshape(12, count, 8).transpose(0, 2, 1)
+    octets = np.ascontiguousarray(octets)
+    packed = np.zeros(count, np.int64)
+    phase = np.zeros(count, np.int64)
+    for index in range(12):
+        for number in range(8):
+            packed += SCORE_BYTES[index, number][octets[index, number]]
+        if PHASE_WEIGHTS[index % 6]:
+            phase += PHASE_WEIGHTS[index % 6] * _popcount(columns[index])
+    eg = (packed + (1 << (EG_SHIFT - 1))) >> EG_SHIFT
+    mg = packed - (eg << EG_SHIFT)
+    phase = np.minimum(phase, MAX_PHASE)
+    return (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+def _mobility(columns: np.ndarray) -> np.ndarray:
+    """Returns mobility score of `chess.evaluation.mobility`"""
+    own = [np.bitwise_or.reduce(columns[base : base + 6]) for base in (0, 6)]
+    empty = ~(own[0] | own[1])
+    score = np.zeros(columns.shape[1], np.int64)
+    for color_index, sign in ((0, 1), (1, -1)):
+        base = color_index * 6
+        knights = columns[base + KNIGHT]
+        attacked = np.zeros_like(knights)
+        for step in _KNIGHT_STEPS:
+            attacked |= _shift(knights, step)
+        queens = columns[base + QUEEN]
+        by_kind = {
+            KNIGHT: attacked,
+            BISHOP: _slide(columns[base + BISHOP], empty, _BISHOP_STEPS),
+            ROOK: _slide(columns[base + ROOK], empty, _ROOK_STEPS),
+            QUEEN: _slide(queens, empty, _ROOK_STEPS + _BISHOP_STEPS),
+        }
+        for kind, attacked in by_kind.items():
+            count = _popcount(attacked & ~own[color_index])
+            score += sign * MOBILITY_WEIGHTS[kind] * count
+    return score
+
+
+def _pawn_structure(columns: np.ndarray) -> np.ndarray:
+    """Returns pawn structure score of `chess.evaluation.pawn_structure`"""
+    score = np.zeros(columns.shape[1], np.int64)
+    for color_index, sign in ((0, 1), (1, -1)):
+        pawns = columns[color_index * 6 + PAWN]
+        enemy = columns[(1 - color_index) * 6 + PAWN]
+        for col in range(8):
+            count = _popcount(pawns & U64(FILES[col]))
+            score += sign * DOUBLED_PAWN * np.maximum(count - 1, 0)
+            isolated = (pawns & U64(ADJACENT_FILES[col])) == 0
+            score += sign * ISOLATED_PAWN * count * isolated
+        # Squares behind enemy pawns as seen by them, on their and next files
+        forward = _ROOK_STEPS[1] if color_index == 0 else _ROOK_STEPS[0]
+        behind = _shift(enemy, forward)
+        for _ in range(5):
+            behind |= _shift(behind, forward)
+        behind |= _shift(behind, _ROOK_STEPS[2]) | _shift(behind, _ROOK_STEPS[3])
+        passed = pawns & ~behind
+        for row in range(1, 7):
+            rows_left = row if color_index == 0 else 7 - row
+            count = _popcount(passed & U64(ROWS[row]))
+            score += sign * PASSED_PAWN[rows_left] * count
+    return score
+
+
+def evaluate_batch(
+    bitboards: np.ndarray, colors: np.ndarray, full: bool = True
+) -> np.ndarray:
+    """Returns scores of positions from the side to move's point of view,
+    equal to `evaluate_full`, or to `evaluate` if not `full`"""
+    bitboards = np.asarray(bitboards, dtype=U64)
+    scores = np.empty(len(bitboards), np.int64)
+    for start in range(0, len(bitboards), CHUNK):
+        # One contiguous row per bitboard type
+        columns = np.ascontiguousarray(bitboards[start : start + CHUNK].T)
+        score = _material(columns)
+        if full:
+            score += _mobility(columns) + _pawn_structure(columns)
+        scores[start : start + CHUNK] = score
+    return np.where(np.asarray(colors) == 0, scores, -scores)
+
+
+def save_npy(
+    prefix: str,
+    bitboards: np.ndarray,
+    colors: np.ndarray,
+    scores: np.ndarray | None = None,
+    as_planes: bool = False,
+) -> list[str]:
+    """Write arrays to `PREFIX.bitboards.npy` (or `PREFIX.planes.npy`),
+    `PREFIX.colors.npy` and `PREFIX.scores.npy`. Returns written paths"""
+    arrays = {"colors": colors}
+    if as_planes:
+        arrays["planes"] = planes(bitboards)
+    else:
+        arrays["bitboards"] = bitboards
+    if scores is not None:
+        arrays["scores"] = scores
+    paths = []
+    for name, array in arrays.items():
+        path = f"{prefix}.{name}.npy"
+        np.save(path, array)
+        paths.append(path)
+    return paths
+
+
+def main(argv: list[str] | None = None) -> int:
+    """main"""
+    from .batch import read_positions
+
+    parser = argparse.ArgumentParser(
+        prog="python -m chess.vectorized", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("file", help="FEN or EPD file, one position per line")
+    parser.add_argument("--npy", metavar="PREFIX", help="save arrays and scores")
+    parser.add_argument("--planes", action="store_true", help="save (N, 12, 8, 8)")
+    parser.add_argument("--no-check", action="store_true", help="skip scalar check")
+    args = parser.parse_args(argv)
+
+    with open(args.file, encoding="utf-8") as stream:
+        boards = [Board(fen) for fen, _ in read_positions(stream)]
+    start = time.perf_counter()
+    bitboards, colors = to_arrays(boards)
+    packed = time.perf_counter()
+    scores = evaluate_batch(bitboards, colors)
+    done = time.perf_counter()
+    count = len(boards)
+    print(
+        f"{count} positions: packed in {packed - start:.3f}s, "
+        f"evaluated in {done - packed:.3f}s, "
+        f"{count / max((done - packed) * 1e6, 1e-9):.2f} positions/us"
+    )
+
+    if not args.no_check:
+        start = time.perf_counter()
+        expected = [evaluate_full(board) for board in boards]
+        elapsed = time.perf_counter() - start
+        mismatches = int(np.count_nonzero(scores != np.array(expected)))
+        print(
+            f"scalar: {count / max(elapsed * 1e6, 1e-9):.4f} positions/us, "
+            f"{mismatches} mismatches"
+        )
+        if mismatches:
+            return 1
+    if args.npy:
+        for path in save_npy(args.npy, bitboards, colors, scores, args.planes):
+            print(f"written {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
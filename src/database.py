@@ -1,70 +1,503 @@
+"""Game session storage in SQLite
+
+A game is stored as its start position plus the moves packed as 16-bit
+codes in one BLOB, with a FEN checkpoint every `CHECKPOINT_INTERVAL`
+plies, so any ply is rebuilt by replaying from the nearest checkpoint.
+A session slot points at the game in progress.
+
+Every position of every game is indexed by its Zobrist key in the `moves`
+table, and games are indexed by player, date and result, so queries like
+`games_with_key` or `player_stats` stay fast on large archives.
+Archives are loaded with `import_pgn`. `leaderboard` is a view of results.
+
+The database runs in WAL mode, so readers do not block the writer and a
+commit does not wait for a full fsync. Moves are buffered and written in
+one transaction once `flush_size` moves are pending or `flush_interval`
+seconds have passed. The schema version is kept in `PRAGMA user_version`
+and upgraded by `migrate` when the database is opened.
+"""
+
 import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, NamedTuple, Sequence, TextIO
 
+from chess.board import Board, START_FEN
+from chess.move import Move, pack_moves, unpack_codes
+from chess.pgn import Game, read_games
+from chess.utils import Color
 
-class Database:
-    def __init__(self) -> None:
-        self.db = sqlite3.connect("session.sqlite")
-        self.cur = self.db.cursor()
+DEFAULT_PATH = "session.sqlite"
+FLUSH_INTERVAL = 1.0
+FLUSH_SIZE = 32
+CHECKPOINT_INTERVAL = 32
+# Games written per transaction by `import_pgn`
+IMPORT_BATCH = 1000
+# Milliseconds to wait for a lock held by another connection
+BUSY_TIMEOUT = 5000
 
-        self.cur.execute(
-            "CREATE TABLE IF NOT EXISTS leaderboard(Id INTEGER PRIMARY KEY AUTOINCREMENT, Winner TEXT);"
-        )
+RESULT_IDS = {"*": 0, "1-0": 1, "0-1": 2, "1/2-1/2": 3}
+RESULTS = {result_id: result for result, result_id in RESULT_IDS.items()}
 
-    def get_field(self) -> str | None:
-        table = self.cur.execute(
-            """SELECT name FROM sqlite_master WHERE type='table'
-  AND name='session'; """
-        ).fetchall()
 
-        if table:
-            return self.cur.execute(
-                """SELECT Field FROM session ORDER BY Id DESC LIMIT 1"""
-            ).fetchone()[0]
+class PlayerStats(NamedTuple):
+    """Finished games of a player"""
 
-        self.cur.execute(
-            "CREATE TABLE session(Id INTEGER PRIMARY KEY AUTOINCREMENT, Field TEXT, Turn TEXT);"
-        )
+    games: int
+    wins: int
+    draws: int
+    losses: int
+
+    @property
+    def win_rate(self) -> float:
+        """Points per game, a draw is half a point"""
+        return (self.wins + self.draws / 2) / self.games if self.games else 0.0
+
+
+class GameInfo(NamedTuple):
+    """Summary row of `find_games`"""
 
-        return None
+    id: int
+    white: str | None
+    black: str | None
+    result: str
+    date: str | None
+    plies: int
 
-    def get_session(self) -> tuple[str, ...] | None:
-        table = self.cur.execute(
-            """SELECT name FROM sqlite_master WHERE type='table'
-  AND name='session'; """
-        ).fetchall()
 
-        if table:
-            session = self.cur.execute(
-                """SELECT Field, Turn FROM session ORDER BY Id DESC LIMIT 1"""
-            ).fetchone()
-            return session
+def _signed(key: int) -> int:
+    """Returns 64-bit Zobrist key as signed, the range SQLite integers hold"""
+    return key - (1 << 64) if key >> 63 else key
 
-        self.create_session()
 
-        return None
+def _position_rows(game: int, board: Board, codes: list[int]) -> tuple[list, list]:
+    """Replay moves on board, returns rows for `moves` and `checkpoints`"""
+    positions = [(_signed(board.key), game, 0, 0)]
+    checkpoints = []
+    for ply, code in enumerate(codes, 1):
+        board.make_move(board.decode_move(code))
+        positions.append((_signed(board.key), game, ply, code))
+        if ply % CHECKPOINT_INTERVAL == 0:
+            checkpoints.append((game, ply, board.to_fen()))
+    return positions, checkpoints
 
-    def create_session(self) -> None:
-        self.cur.execute(
-            "CREATE TABLE session(Id INTEGER PRIMARY KEY AUTOINCREMENT, Field TEXT, Turn TEXT);"
+
+def _session_fen(field: str, turn: str) -> str:
+    """Returns FEN of a session row, converting the old `field_as_text` format"""
+    if "/" in field:
+        return field
+    board = Board()
+    board.field_from_text(field)
+    board.set_active_color(Color.from_char(turn))
+    return board.to_fen()
+
+
+def _games_from_sessions(cur: sqlite3.Cursor) -> None:
+    """Move the last position of every session into the games table"""
+    rows = cur.execute("""SELECT Game, Field, Turn FROM session
+        WHERE Id IN (SELECT MAX(Id) FROM session GROUP BY Game)""").fetchall()
+    for slot, field, turn in rows:
+        cur.execute("INSERT INTO games(Fen) VALUES(?)", (_session_fen(field, turn),))
+        cur.execute(
+            "INSERT INTO sessions(Slot, Game) VALUES(?, ?)", (slot, cur.lastrowid)
         )
+    cur.execute("DROP TABLE session")
+
+
+def _index_games(cur: sqlite3.Cursor) -> None:
+    """Index positions of stored games, turn old winners into game results"""
+    for game, fen, moves in cur.execute("SELECT Id, Fen, Moves FROM games").fetchall():
+        positions, _ = _position_rows(game, Board.from_fen(fen), unpack_codes(moves))
+        cur.executemany(INSERT_POSITION, positions)
+    cur.execute(
+        """INSERT INTO games(Fen, Result)
+        SELECT ?, CASE Winner WHEN 'w' THEN 1 ELSE 2 END FROM leaderboard""",
+        (START_FEN,),
+    )
+    cur.execute("DROP TABLE leaderboard")
+    cur.execute("""CREATE VIEW leaderboard AS
+        SELECT Id, CASE Result WHEN 1 THEN 'w' ELSE 'b' END AS Winner
+        FROM games WHERE Result IN (1, 2)""")
+
 
-    def add_move(
+# Schema upgrades, `MIGRATIONS[i]` takes the database to version `i + 1`.
+# A step is a script of statements or a function run on the cursor
+MIGRATIONS: tuple[str | Callable[[sqlite3.Cursor], None], ...] = (
+    # Tables of the first versions, created on demand before
+    """
+    CREATE TABLE IF NOT EXISTS leaderboard(
+        Id INTEGER PRIMARY KEY AUTOINCREMENT, Winner TEXT);
+    CREATE TABLE IF NOT EXISTS session(
+        Id INTEGER PRIMARY KEY AUTOINCREMENT, Field TEXT, Turn TEXT);
+    """,
+    # Sessions of several games in one database
+    """
+    ALTER TABLE session ADD COLUMN Game INTEGER NOT NULL DEFAULT 0;
+    CREATE INDEX session_game ON session(Game, Id);
+    """,
+    # Games as start position and packed moves instead of a row per position
+    """
+    CREATE TABLE games(
+        Id INTEGER PRIMARY KEY, Fen TEXT NOT NULL, Moves BLOB NOT NULL DEFAULT x'');
+    CREATE TABLE checkpoints(
+        Game INTEGER NOT NULL REFERENCES games(Id), Ply INTEGER NOT NULL,
+        Fen TEXT NOT NULL, PRIMARY KEY(Game, Ply)) WITHOUT ROWID;
+    CREATE TABLE sessions(
+        Slot INTEGER PRIMARY KEY, Game INTEGER NOT NULL REFERENCES games(Id));
+    """,
+    _games_from_sessions,
+    # Players, results and the position index
+    """
+    CREATE TABLE players(Id INTEGER PRIMARY KEY, Name TEXT NOT NULL UNIQUE);
+    CREATE TABLE results(Id INTEGER PRIMARY KEY, Result TEXT NOT NULL UNIQUE);
+    INSERT INTO results(Id, Result)
+        VALUES(0, '*'), (1, '1-0'), (2, '0-1'), (3, '1/2-1/2');
+    ALTER TABLE games ADD COLUMN White INTEGER REFERENCES players(Id);
+    ALTER TABLE games ADD COLUMN Black INTEGER REFERENCES players(Id);
+    ALTER TABLE games ADD COLUMN Result INTEGER NOT NULL DEFAULT 0
+        REFERENCES results(Id);
+    ALTER TABLE games ADD COLUMN Date TEXT;
+    ALTER TABLE games ADD COLUMN Event TEXT;
+    CREATE INDEX games_white ON games(White, Result);
+    CREATE INDEX games_black ON games(Black, Result);
+    CREATE INDEX games_date ON games(Date);
+    CREATE INDEX games_result ON games(Result);
+    CREATE TABLE moves(
+        Key INTEGER NOT NULL, Game INTEGER NOT NULL REFERENCES games(Id),
+        Ply INTEGER NOT NULL, Move INTEGER NOT NULL,
+        PRIMARY KEY(Key, Game, Ply)) WITHOUT ROWID;
+    """,
+    _index_games,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+INSERT_GAME = "INSERT INTO games(Fen) VALUES(?)"
+UPDATE_MOVES = "UPDATE games SET Moves = ? WHERE Id = ?"
+INSERT_CHECKPOINT = "INSERT OR REPLACE INTO checkpoints(Game, Ply, Fen) VALUES(?, ?, ?)"
+SELECT_GAME = "SELECT Fen, Moves FROM games WHERE Id = ?"
+SELECT_PLIES = "SELECT length(Moves) / 2 FROM games WHERE Id = ?"
+SELECT_CHECKPOINT = """SELECT Ply, Fen FROM checkpoints
+    WHERE Game = ? AND Ply <= ? ORDER BY Ply DESC LIMIT 1"""
+SELECT_SESSION = "SELECT Game FROM sessions WHERE Slot = ?"
+INSERT_SESSION = "INSERT OR REPLACE INTO sessions(Slot, Game) VALUES(?, ?)"
+DELETE_SESSION = "DELETE FROM sessions WHERE Slot = ?"
+UPDATE_RESULT = "UPDATE games SET Result = ? WHERE Id = ?"
+INSERT_POSITION = "INSERT OR IGNORE INTO moves(Key, Game, Ply, Move) VALUES(?, ?, ?, ?)"
+INSERT_PLAYER = "INSERT OR IGNORE INTO players(Name) VALUES(?)"
+SELECT_PLAYER = "SELECT Id FROM players WHERE Name = ?"
+INSERT_IMPORTED = """INSERT INTO games(Fen, Moves, White, Black, Result, Date, Event)
+    VALUES(?, ?, ?, ?, ?, ?, ?)"""
+SELECT_KEY = "SELECT DISTINCT Game FROM moves WHERE Key = ? ORDER BY Game LIMIT ?"
+# Wins, draws and losses of a player with white and with black
+SELECT_WHITE_STATS = """SELECT COUNT(*),
+    SUM(Result = 1), SUM(Result = 3), SUM(Result = 2)
+    FROM games WHERE White = ? AND Result != 0"""
+SELECT_BLACK_STATS = """SELECT COUNT(*),
+    SUM(Result = 2), SUM(Result = 3), SUM(Result = 1)
+    FROM games WHERE Black = ? AND Result != 0"""
+PLAYER_ID = "(SELECT Id FROM players WHERE Name = ?)"
+SELECT_GAME_INFO = """SELECT games.Id, white.Name, black.Name, Result, Date,
+    length(Moves) / 2 FROM games
+    LEFT JOIN players AS white ON white.Id = White
+    LEFT JOIN players AS black ON black.Id = Black"""
+
+
+class Database:
+    def __init__(
         self,
-        field: str,
-        turn: str,
+        path: str = DEFAULT_PATH,
+        session: int = 0,
+        flush_interval: float = FLUSH_INTERVAL,
+        flush_size: int = FLUSH_SIZE,
     ) -> None:
-        self.cur.execute(
-            f"INSERT INTO session(Field, Turn) VALUES('{field}', '{turn}');"
-        )
-        # self.db.commit()
+        """`path`: Database file
+        `session`: Session slot, sessions in different slots do not interfere
+        `flush_interval`: Seconds moves may wait in memory before being written
+        `flush_size`: Number of pending moves that triggers a write
+        """
+        # Transactions are opened explicitly by `transaction`
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT}")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        # Safe with WAL: a crash may lose the last commits, never corrupts
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.cur = self.db.cursor()
+
+        self.session = session
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        # Game of the session, created by the first move
+        self.game: int | None = None
+        self.plies = 0
+        # Moves and Zobrist keys of the positions they lead to
+        self.pending: list[tuple[Move, int]] = []
+        self.checkpoints: list[tuple[int, int, str]] = []
+        self.last_flush = time.monotonic()
+        # Player ids by name
+        self.players: dict[str, int] = {}
+
+        self.migrate()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Cursor]:
+        """Run statements in one transaction, rolled back on error"""
+        self.cur.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.cur
+        except BaseException:
+            self.cur.execute("ROLLBACK")
+            raise
+        self.cur.execute("COMMIT")
+
+    def migrate(self) -> None:
+        """Upgrade schema to `SCHEMA_VERSION`"""
+        with self.transaction() as cur:
+            version = cur.execute("PRAGMA user_version").fetchone()[0]
+            for step in MIGRATIONS[version:]:
+                if callable(step):
+                    step(cur)
+                    continue
+                for statement in step.split(";"):
+                    if statement.strip():
+                        cur.execute(statement)
+            if version != SCHEMA_VERSION:
+                cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def flush(self) -> None:
+        """Write pending moves and checkpoints"""
+        if self.pending:
+            first = self.plies - len(self.pending) + 1
+            self.append_moves(
+                [
+                    (self.game, ply, move, key)
+                    for ply, (move, key) in enumerate(self.pending, first)
+                ],
+                self.checkpoints,
+            )
+            self.pending.clear()
+            self.checkpoints.clear()
+        self.last_flush = time.monotonic()
+
+    def _insert_game(self, cur: sqlite3.Cursor, board: Board) -> int:
+        cur.execute(INSERT_GAME, (board.to_fen(),))
+        game = cur.lastrowid
+        cur.execute(INSERT_POSITION, (_signed(board.key), game, 0, 0))
+        return game
+
+    def create_game(self, board: Board) -> int:
+        """Insert a game starting from the position of board, returns its id"""
+        with self.transaction() as cur:
+            return self._insert_game(cur, board)
+
+    def append_moves(
+        self,
+        moves: list[tuple[int, int, Move, int]],
+        checkpoints: Sequence[tuple[int, int, str]] = (),
+    ) -> None:
+        """Append moves of any number of games in one transaction.
+        `moves`: (game, ply, move, key of the position after it), in ply order
+        `checkpoints`: (game, ply, FEN)
+        """
+        by_game: dict[int, list[Move]] = {}
+        for game, _, move, _ in moves:
+            by_game.setdefault(game, []).append(move)
+        with self.transaction() as cur:
+            for game, game_moves in by_game.items():
+                # Appended in Python: `||` would turn the BLOB into TEXT
+                data = cur.execute(SELECT_GAME, (game,)).fetchone()[1]
+                cur.execute(UPDATE_MOVES, (data + pack_moves(game_moves), game))
+            cur.executemany(INSERT_CHECKPOINT, checkpoints)
+            cur.executemany(
+                INSERT_POSITION,
+                [
+                    (_signed(key), game, ply, move.encode())
+                    for game, ply, move, key in moves
+                ],
+            )
+
+    def load_board(self, game: int, ply: int | None = None) -> Board:
+        """Returns position of game after `ply` half-moves, the last by default.
+        Moves are replayed from the nearest checkpoint"""
+        if game == self.game:
+            self.flush()
+        row = self.cur.execute(SELECT_GAME, (game,)).fetchone()
+        if row is None:
+            raise KeyError(f"No game {game}")
+        fen, moves = row
+        codes = unpack_codes(moves)
+        if ply is None or ply > len(codes):
+            ply = len(codes)
+        start = 0
+        if checkpoint := self.cur.execute(SELECT_CHECKPOINT, (game, ply)).fetchone():
+            start, fen = checkpoint
+        board = Board.from_fen(fen)
+        for code in codes[start:ply]:
+            board.make_move(board.decode_move(code))
+        board.check_check()
+        return board
+
+    def get_session(self) -> Board | None:
+        """Returns board of the game in progress or None"""
+        self.flush()
+        row = self.cur.execute(SELECT_SESSION, (self.session,)).fetchone()
+        if row is None:
+            return None
+        self.game = row[0]
+        board = self.load_board(self.game)
+        self.plies = self.cur.execute(SELECT_PLIES, (self.game,)).fetchone()[0]
+        return board
+
+    def add_move(self, board: Board) -> None:
+        """Save the last move played on board.
+        Written once enough moves are pending or enough time has passed"""
+        if not board.history:
+            return
+        move = board.history[-1][0]
+        if self.game is None:
+            # New game starts from the position before this move,
+            # taken back on a copy so the caller's board keeps its state
+            start = board.copy()
+            start.unmake_move()
+            with self.transaction() as cur:
+                self.game = self._insert_game(cur, start)
+                cur.execute(INSERT_SESSION, (self.session, self.game))
+            self.plies = 0
+
+        self.pending.append((move, board.key))
+        self.plies += 1
+        if self.plies % CHECKPOINT_INTERVAL == 0:
+            self.checkpoints.append((self.game, self.plies, board.to_fen()))
+        if (
+            len(self.pending) >= self.flush_size
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush()
 
     def close(self) -> None:
-        self.db.commit()
+        self.flush()
         self.db.close()
 
     def clear_session(self) -> None:
-        self.cur.execute("""DROP TABLE session""")
-        # self.db.commit()
+        """Detach the game from the session, it stays in the games table"""
+        self.flush()
+        with self.transaction() as cur:
+            cur.execute(DELETE_SESSION, (self.session,))
+        self.game = None
+        self.plies = 0
+
+    def set_result(self, result: str, game: int | None = None) -> None:
+        """Record result of a game, the session game by default:
+        `1-0`, `0-1`, `1/2-1/2` or `*`"""
+        self.flush()
+        if game is None:
+            game = self.game
+        if game is None:
+            return
+        with self.transaction() as cur:
+            cur.execute(UPDATE_RESULT, (RESULT_IDS[result], game))
+
+    def _player_id(self, cur: sqlite3.Cursor, name: str | None) -> int | None:
+        if not name or name == "?":
+            return None
+        if name not in self.players:
+            cur.execute(INSERT_PLAYER, (name,))
+            self.players[name] = cur.execute(SELECT_PLAYER, (name,)).fetchone()[0]
+        return self.players[name]
 
-    def write_leaderboard(self, winner) -> None:
-        self.cur.execute(f"INSERT INTO leaderboard(Winner) VALUES('{winner}')")
+    def _insert_games(self, games: list[Game]) -> int:
+        """Returns number of games inserted, games with a bad FEN tag are not"""
+        count = 0
+        with self.transaction() as cur:
+            for game in games:
+                try:
+                    board = game.board(0)
+                except ValueError:
+                    continue
+                headers = game.headers
+                date = headers.get("Date")
+                codes = [move.encode() for move in game.moves]
+                cur.execute(
+                    INSERT_IMPORTED,
+                    (
+                        board.to_fen(),
+                        pack_moves(game.moves),
+                        self._player_id(cur, headers.get("White")),
+                        self._player_id(cur, headers.get("Black")),
+                        RESULT_IDS.get(game.result, 0),
+                        date if date and "?" not in date else None,
+                        headers.get("Event"),
+                    ),
+                )
+                positions, checkpoints = _position_rows(cur.lastrowid, board, codes)
+                cur.executemany(INSERT_POSITION, positions)
+                cur.executemany(INSERT_CHECKPOINT, checkpoints)
+                count += 1
+        return count
+
+    def import_pgn(self, stream: TextIO, batch_size: int = IMPORT_BATCH) -> int:
+        """Add every game of a PGN stream, returns number of games added.
+        Games with bad movetext are kept up to the first bad move,
+        games with a malformed FEN tag are skipped"""
+        count = 0
+        batch = []
+        for game in read_games(stream):
+            batch.append(game)
+            if len(batch) >= batch_size:
+                count += self._insert_games(batch)
+                batch = []
+        if batch:
+            count += self._insert_games(batch)
+        return count
+
+    def games_with_key(self, key: int, limit: int = 100) -> list[int]:
+        """Returns ids of games that reached position with Zobrist `key`"""
+        self.flush()
+        rows = self.cur.execute(SELECT_KEY, (_signed(key), limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def player_stats(self, name: str) -> PlayerStats:
+        """Returns results of finished games of a player"""
+        row = self.cur.execute(SELECT_PLAYER, (name,)).fetchone()
+        if row is None:
+            return PlayerStats(0, 0, 0, 0)
+        totals = [0, 0, 0, 0]
+        for query in (SELECT_WHITE_STATS, SELECT_BLACK_STATS):
+            counts = self.cur.execute(query, row).fetchone()
+            totals = [total + (count or 0) for total, count in zip(totals, counts)]
+        return PlayerStats(*totals)
+
+    def find_games(
+        self,
+        player: str | None = None,
+        result: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        limit: int = 100,
+    ) -> list[GameInfo]:
+        """Returns games matching all given filters, newest first.
+        Dates are PGN dates like `2024.01.31` and bounds are inclusive"""
+        conditions = []
+        params: list = []
+        if player is not None:
+            conditions.append(f"(White = {PLAYER_ID} OR Black = {PLAYER_ID})")
+            params += [player, player]
+        if result is not None:
+            conditions.append("Result = ?")
+            params.append(RESULT_IDS[result])
+        if since is not None:
+            conditions.append("Date >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("Date <= ?")
+            params.append(until)
+        query = SELECT_GAME_INFO
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY games.Id DESC LIMIT ?"
+        params.append(limit)
+        return [
+            GameInfo(id, white, black, RESULTS[result_id], date, plies)
+            for id, white, black, result_id, date, plies in self.cur.execute(
+                query, params
+            )
+        ]
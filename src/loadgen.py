@@ -0,0 +1,142 @@
+"""Load generator for the game server
+
+Simulates many clients at once: every client opens a game and plays
+random legal moves for both sides, waiting for each update before the
+next move. Reports round-trip latency, throughput and the server stats.
+
+Usage: python loadgen.py [-n CLIENTS] [-m MOVES] [--engine-every K]
+                         [--host HOST] [--port PORT]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from chess.board import Board
+from server import DEFAULT_HOST, DEFAULT_PORT, _percentiles
+
+DEFAULT_CLIENTS = 100
+DEFAULT_MOVES = 40
+ENGINE_MOVETIME = 0.05
+
+
+async def _reply(reader: asyncio.StreamReader, *prefixes: str) -> list[str]:
+    """Returns fields of the next line starting with one of prefixes,
+    raises ValueError on `error`"""
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        fields = line.decode().split()
+        if fields[0] == "error":
+            raise ValueError(" ".join(fields[1:]))
+        if fields[0] in prefixes:
+            return fields
+
+
+async def run_client(
+    host: str,
+    port: int,
+    moves: int,
+    engine_every: int,
+    rng: random.Random,
+    latencies: list[float],
+) -> int:
+    """Play one game, returns number of moves made"""
+    reader, writer = await asyncio.open_connection(host, port)
+    made = 0
+    try:
+        writer.write(b"new\n")
+        _, game_id, *fen = await _reply(reader, "game")
+        board = Board.from_fen(" ".join(fen))
+        for number in range(1, moves + 1):
+            legal = {move.uci(): move for move in board.legal_moves()}
+            if not legal:
+                break
+            start = time.perf_counter()
+            if engine_every and number % engine_every == 0:
+                writer.write(f"engine {game_id} {ENGINE_MOVETIME}\n".encode())
+            else:
+                text = rng.choice(list(legal))
+                writer.write(f"move {game_id} {text}\n".encode())
+            try:
+                _, _, _, text, *_ = await _reply(reader, "update")
+            except ValueError:
+                break
+            latencies.append(time.perf_counter() - start)
+            board.make_move(legal[text])
+            made += 1
+        writer.write(b"quit\n")
+        await writer.drain()
+    finally:
+        writer.close()
+    return made
+
+
+async def _server_stats(host: str, port: int) -> dict:
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b"stats\n")
+    _, text = (await reader.readline()).decode().split(" ", 1)
+    writer.write(b"quit\n")
+    writer.close()
+    return json.loads(text)
+
+
+async def run_load(
+    host: str, port: int, clients: int, moves: int, engine_every: int, seed: int
+) -> int:
+    latencies: list[float] = []
+    start = time.perf_counter()
+    made = await asyncio.gather(
+        *(
+            run_client(
+                host, port, moves, engine_every, random.Random(seed + i), latencies
+            )
+            for i in range(clients)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    total = sum(made)
+    print(
+        f"{clients} clients, {total} moves in {elapsed:.2f}s, "
+        f"{total / elapsed:.0f} moves/s"
+    )
+    print(f"round trip: {json.dumps(_percentiles(latencies))}")
+    print(f"server: {json.dumps(await _server_stats(host, port))}")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    """main"""
+    parser = argparse.ArgumentParser(
+        prog="python loadgen.py", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("-n", "--clients", type=int, default=DEFAULT_CLIENTS)
+    parser.add_argument("-m", "--moves", type=int, default=DEFAULT_MOVES)
+    parser.add_argument(
+        "--engine-every",
+        type=int,
+        default=0,
+        help="let the engine make every K-th move",
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    return asyncio.run(
+        run_load(
+            args.host,
+            args.port,
+            args.clients,
+            args.moves,
+            args.engine_every,
+            args.seed,
+        )
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
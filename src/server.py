@@ -0,0 +1,440 @@
+"""Game server hosting many concurrent games
+
+One asyncio process keeps every game's Board in memory and speaks a line
+protocol over TCP. Moves are checked against the cached legal moves of the
+position and pushed to every subscriber of the game. Engine searches run
+in a process pool, so they never stall the event loop. Moves reach the
+database through `MoveWriter`, which writes them in batches from a
+dedicated thread.
+
+Commands, one per line, answered on the same connection:
+    new [FEN]                 game <id> <fen>, the client joins the game
+    join <id>                 game <id> <fen>
+    leave <id>                left <id>
+    move <id> <uci>           update <id> <ply> <uci> <fen> to all subscribers
+    engine <id> [movetime]    the engine moves, an update as above
+    stats [id]                stats <json>
+    quit
+Failed commands are answered with `error <message>`. When a game ends,
+`over <id> <result>` is sent to its subscribers.
+
+Usage: python server.py [--host HOST] [--port PORT] [--db PATH] [--workers N]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from chess.board import Board, START_FEN
+from chess.engine import DEFAULT_TT_MB, search
+from chess.move import Move
+from chess.transposition import TranspositionTable
+from database import CHECKPOINT_INTERVAL, Database
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_DB = "server.sqlite"
+DEFAULT_MOVETIME = 0.5
+MAX_MOVETIME = 10.0
+# Transposition table of every engine worker
+WORKER_TT_MB = 16
+# Rows per database transaction, and seconds a move may wait for its batch
+WRITE_BATCH = 1024
+WRITE_INTERVAL = 0.05
+# Latencies kept per game and for the whole server
+LATENCY_WINDOW = 256
+SERVER_LATENCY_WINDOW = 65536
+# Bytes queued for a client before it is dropped as too slow
+MAX_CLIENT_BUFFER = 1 << 20
+
+_worker_tt: TranspositionTable | None = None
+
+
+def _init_worker(tt_mb: float) -> None:
+    global _worker_tt
+    # Ctrl+C reaches the whole process group: the server shuts workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_tt = TranspositionTable(tt_mb)
+
+
+def _engine_move(position: bytes, keys: list[int], movetime: float) -> str | None:
+    """Returns best move of `Board.to_bytes` position in coordinate notation
+    or None. `keys`: `Board.repetition_keys` of the game, so the search sees
+    repetitions. Runs in an engine worker process"""
+    tt = _worker_tt if _worker_tt is not None else TranspositionTable(DEFAULT_TT_MB)
+    board = Board.from_bytes(position)
+    board.set_repetition_keys(keys)
+    result = search(board, movetime=movetime, tt=tt)
+    return result.move.uci() if result.move is not None else None
+
+
+def _percentiles(latencies) -> dict:
+    """Returns median, 99th percentile and maximum in milliseconds"""
+    values = sorted(latencies)
+    if not values:
+        return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+    return {
+        "p50_ms": round(values[len(values) // 2] * 1000, 3),
+        "p99_ms": round(
+            values[min(len(values) * 99 // 100, len(values) - 1)] * 1000, 3
+        ),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+
+class MoveWriter:
+    """Writes moves and results of all games in batches.
+    SQLite allows one writer at a time, so one connection lives in one
+    thread; the event loop only queues rows and never waits for the disk"""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_DB,
+        batch_size: int = WRITE_BATCH,
+        interval: float = WRITE_INTERVAL,
+    ) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="database")
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.db: Database | None = None
+        self.task: asyncio.Task | None = None
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def open(self) -> None:
+        self.db = await self._call(Database, self.path)
+        self.task = asyncio.create_task(self.run())
+
+    async def create_game(self, board: Board) -> int:
+        """Insert a game starting from the position of board, returns its id"""
+        return await self._call(self.db.create_game, board)
+
+    def add_move(self, game: int, ply: int, board: Board) -> None:
+        """Queue the last move played on board"""
+        fen = board.to_fen() if ply % CHECKPOINT_INTERVAL == 0 else None
+        self.queue.put_nowait(("move", game, ply, board.history[-1][0], board.key, fen))
+
+    def set_result(self, game: int, result: str) -> None:
+        self.queue.put_nowait(("result", game, result))
+
+    async def run(self) -> None:
+        """Write queued rows until `close`"""
+        queue = self.queue
+        while True:
+            batch = [await queue.get()]
+            if queue.qsize() < self.batch_size:
+                # Let more rows gather, so one transaction serves many games
+                await asyncio.sleep(self.interval)
+            for _ in range(min(queue.qsize(), self.batch_size - 1)):
+                batch.append(queue.get_nowait())
+            closing = batch[-1] is None
+            if closing:
+                batch.pop()
+            if batch:
+                try:
+                    await self._call(self._write, batch)
+                except Exception as e:
+                    # Rows of this batch are lost, later batches are still written
+                    self.errors += 1
+                    print(f"write of {len(batch)} rows failed: {e}", file=sys.stderr)
+                else:
+                    self.batches += 1
+                    self.rows += len(batch)
+            if closing:
+                return
+
+    def _write(self, batch: list[tuple]) -> None:
+        moves = []
+        checkpoints = []
+        results = []
+        for kind, game, *data in batch:
+            if kind == "result":
+                results.append((game, data[0]))
+                continue
+            ply, move, key, fen = data
+            moves.append((game, ply, move, key))
+            if fen is not None:
+                checkpoints.append((game, ply, fen))
+        if moves:
+            self.db.append_moves(moves, checkpoints)
+        for game, result in results:
+            self.db.set_result(result, game)
+
+    async def close(self) -> None:
+        """Write everything queued and close the database"""
+        if self.task is not None:
+            self.queue.put_nowait(None)
+            await self.task
+        if self.db is not None:
+            await self._call(self.db.close)
+        self.executor.shutdown()
+
+
+class Client:
+    """One connection and the games it follows"""
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.games: set[int] = set()
+
+    def send(self, line: str) -> None:
+        """Queue line without waiting, slow clients are disconnected"""
+        writer = self.writer
+        if writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            writer.close()
+            return
+        writer.write(line.encode() + b"\n")
+
+
+class Game:
+    """Position, subscribers and latency samples of one hosted game"""
+
+    def __init__(self, game_id: int, board: Board) -> None:
+        self.id = game_id
+        self.board = board
+        self.subscribers: set[Client] = set()
+        # Legal moves of the position by coordinate notation
+        self.legal: dict[str, Move] = {}
+        self.result: str | None = None
+        self.thinking = False
+        self.plies = 0
+        # Seconds from receiving a move to pushing it to the subscribers
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.update_legal()
+
+    def update_legal(self) -> None:
+        """Cache legal moves and decide whether the game is over"""
+        board = self.board
+        self.legal = {move.uci(): move for move in board.legal_moves()}
+        if not self.legal:
+            if board.king_attacked(board.color):
+                self.result = "0-1" if board.color.index == 0 else "1-0"
+            else:
+                self.result = "1/2-1/2"
+        elif board.halfmove >= 100 or board.is_repetition():
+            self.result = "1/2-1/2"
+
+    def play(self, move: Move) -> None:
+        self.board.make_move(move)
+        self.plies += 1
+        self.update_legal()
+
+    def stats(self) -> dict:
+        return {
+            "game": self.id,
+            "plies": self.plies,
+            "result": self.result,
+            "subscribers": len(self.subscribers),
+            "moves": len(self.latencies),
+            **_percentiles(self.latencies),
+        }
+
+
+class GameServer:
+    """Games of all clients, served by one event loop"""
+
+    def __init__(
+        self,
+        writer: MoveWriter,
+        workers: int | None = None,
+        tt_mb: float = WORKER_TT_MB,
+    ) -> None:
+        self.writer = writer
+        self.pool = ProcessPoolExecutor(
+            workers or os.cpu_count() or 1,
+            initializer=_init_worker,
+            initargs=(tt_mb,),
+        )
+        self.games: dict[int, Game] = {}
+        self.clients: set[Client] = set()
+        self.latencies: deque[float] = deque(maxlen=SERVER_LATENCY_WINDOW)
+        self.moves = 0
+        self.started = time.monotonic()
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        client = Client(writer)
+        self.clients.add(client)
+        try:
+            while not writer.is_closing():
+                line = await reader.readline()
+                if not line:
+                    break
+                received = time.perf_counter()
+                command, *args = line.decode(errors="replace").split() or [""]
+                if command == "quit":
+                    break
+                try:
+                    await self.run_command(client, command, args, received)
+                except (ValueError, IndexError) as e:
+                    client.send(f"error {e}")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            for game_id in client.games:
+                self.games[game_id].subscribers.discard(client)
+            writer.close()
+
+    def _game(self, text: str) -> Game:
+        game = self.games.get(int(text))
+        if game is None:
+            raise ValueError(f"no game {text}")
+        return game
+
+    async def run_command(
+        self, client: Client, command: str, args: list[str], received: float
+    ) -> None:
+        if command == "new":
+            board = Board.from_fen(" ".join(args)) if args else Board(START_FEN)
+            game_id = await self.writer.create_game(board)
+            game = self.games[game_id] = Game(game_id, board)
+            self.subscribe(client, game)
+        elif command == "join":
+            self.subscribe(client, self._game(args[0]))
+        elif command == "leave":
+            game = self._game(args[0])
+            game.subscribers.discard(client)
+            client.games.discard(game.id)
+            client.send(f"left {game.id}")
+        elif command == "move":
+            game = self._game(args[0])
+            move = game.legal.get(args[1])
+            if game.result is not None or game.thinking or move is None:
+                raise ValueError(f"{game.id} illegal move {args[1]}")
+            self.play(game, move, received)
+        elif command == "engine":
+            game = self._game(args[0])
+            if game.result is not None or game.thinking:
+                raise ValueError(f"{game.id} engine cannot move")
+            movetime = min(float(args[1]), MAX_MOVETIME) if len(args) > 1 else None
+            await self.engine_move(game, movetime or DEFAULT_MOVETIME)
+        elif command == "stats":
+            stats = self._game(args[0]).stats() if args else self.stats()
+            client.send(f"stats {json.dumps(stats)}")
+        else:
+            raise ValueError(f"unknown command {command!r}")
+
+    def subscribe(self, client: Client, game: Game) -> None:
+        game.subscribers.add(client)
+        client.games.add(game.id)
+        client.send(f"game {game.id} {game.board.to_fen()}")
+
+    def broadcast(self, game: Game, line: str) -> None:
+        for subscriber in game.subscribers:
+            subscriber.send(line)
+
+    def play(self, game: Game, move: Move, received: float) -> None:
+        """Make validated move, push it to subscribers and queue it for writing"""
+        game.play(move)
+        self.writer.add_move(game.id, game.plies, game.board)
+        self.broadcast(
+            game, f"update {game.id} {game.plies} {move.uci()} {game.board.to_fen()}"
+        )
+        latency = time.perf_counter() - received
+        game.latencies.append(latency)
+        self.latencies.append(latency)
+        self.moves += 1
+        if game.result is not None:
+            self.writer.set_result(game.id, game.result)
+            self.broadcast(game, f"over {game.id} {game.result}")
+
+    async def engine_move(self, game: Game, movetime: float) -> None:
+        """Search in a worker process; other games go on meanwhile"""
+        game.thinking = True
+        try:
+            loop = asyncio.get_running_loop()
+            board = game.board
+            text = await loop.run_in_executor(
+                self.pool,
+                _engine_move,
+                board.to_bytes(),
+                board.repetition_keys(),
+                movetime,
+            )
+        finally:
+            game.thinking = False
+        move = game.legal.get(text) if text is not None else None
+        if move is None:
+            raise ValueError(f"{game.id} engine found no move")
+        self.play(game, move, time.perf_counter())
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            "games": len(self.games),
+            "active": sum(game.result is None for game in self.games.values()),
+            "clients": len(self.clients),
+            "moves": self.moves,
+            "moves_per_s": round(self.moves / elapsed, 1) if elapsed else 0.0,
+            "write_queue": self.writer.queue.qsize(),
+            "write_batches": self.writer.batches,
+            "written_rows": self.writer.rows,
+            "write_errors": self.writer.errors,
+            **_percentiles(self.latencies),
+        }
+
+    def close(self) -> None:
+        for client in self.clients:
+            client.writer.close()
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    path: str = DEFAULT_DB,
+    workers: int | None = None,
+) -> None:
+    """Run server until SIGTERM or cancelled, then write pending moves"""
+    writer = MoveWriter(path)
+    await writer.open()
+    server = GameServer(writer, workers)
+    tcp = await asyncio.start_server(server.handle_client, host, port)
+    print(f"serving on {host}:{port}, games in {path}", file=sys.stderr)
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    try:
+        async with tcp:
+            await stop.wait()
+    finally:
+        server.close()
+        await writer.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """main"""
+    parser = argparse.ArgumentParser(
+        prog="python server.py", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite file for games")
+    parser.add_argument("--workers", type=int, help="engine processes")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.db, args.workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
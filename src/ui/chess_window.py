@@ -1,44 +1,126 @@
 from PyQt6.QtWidgets import QMainWindow, QPushButton, QMessageBox, QLabel
 from PyQt6.QtGui import QPixmap, QIcon, QColorConstants
+from PyQt6.QtCore import QObject, QThread, QTimer, pyqtSignal
+from threading import Event
 
 
 # Dependency injection?
 from chess.board import Board, Color
-from database import Database
+from chess.bitboard import row_col
+from chess.move import CAPTURE, CASTLE, Move
+from chess import engine
+from chess.book import open_book
+from chess.tablebase import open_tablebase
+from database import Database, FLUSH_INTERVAL
 
 
 from ui import PawnPromotionDialog
 
 DIRNAME = __file__.replace("\\", "/").rsplit("/", 1)[0]
 
+# Computer opponent settings
+ENGINE_COLOR = Color.BLACK
+ENGINE_MOVETIME = 1.0
+# Moves buffered before a write: a single game has few moves to batch
+FLUSH_SIZE = 2
+
+# Backgrounds of a cell by highlight and `(row + col) % 2`
+CELL_COLORS = {
+    None: ("#b16040", "#ebdbb2"),
+    "select": ("#00cc00", "#00cc00"),
+    "castle": ("#ffcc00", "#ffcc00"),
+    "attack": ("#aa0000", "#ff0000"),
+    "move": ("#00aaaa", "#00ffff"),
+}
+STYLESHEETS = {
+    (highlight, parity): f"background-color: {colors[parity]}; border: none;"
+    for highlight, colors in CELL_COLORS.items()
+    for parity in (0, 1)
+}
+
+
+class EngineWorker(QObject):
+    """Searches a copy of the board on a worker thread"""
+
+    done = pyqtSignal(object, int)
+
+    def __init__(self, board: Board, book, tablebase, stop: Event, generation: int):
+        super().__init__()
+        self.board = board
+        self.book = book
+        self.tablebase = tablebase
+        self.stop = stop
+        self.generation = generation
+
+    def run(self) -> None:
+        result = engine.search(
+            self.board,
+            movetime=ENGINE_MOVETIME,
+            book=self.book,
+            tablebase=self.tablebase,
+            stop=self.stop,
+        )
+        self.done.emit(result.move, self.generation)
+
 
 class ChessWindow(QMainWindow):
     def __init__(self):
         super().__init__()
 
-        self.db = Database()
-        self.board = Board()
-        if session := self.db.get_session():
-            field, color = session
-            turn = {"w": Color.WHITE, "b": Color.BLACK}[color]
-            self.board.set_active_color(turn)
-            self.board.field_from_text(field)
+        self.db = Database(flush_size=FLUSH_SIZE)
+        # Pending moves are written even while nobody moves
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.db.flush)
+        self.flush_timer.start(int(FLUSH_INTERVAL * 1000))
+        self.book = open_book()
+        self.tablebase = open_tablebase()
+        # Probed by the search thread only, the cache is not shared
+        self.engine_tablebase = open_tablebase()
+        self.engine_thread: QThread | None = None
+        self.engine_worker: EngineWorker | None = None
+        self.engine_stop = Event()
+        # Bumped when a running search must not play its move
+        self.generation = 0
+        board = self.db.get_session()
+        if board is None:
+            board = Board(tablebase=self.tablebase)
+        else:
+            board.tablebase = self.tablebase
+            board.endgame_check()
+        self.board = board
 
         self.buttons: list[list[QPushButton]] = []
         self.label = QLabel(self)
         self.label.setGeometry(15, 380, 90, 20)
         self.select = None
+        # Highlights of the selected cell and its legal destinations
+        self.targets: dict[tuple[int, int], str] = {}
+        # Cell code and stylesheet last set on every button
+        self.painted = [[("", "")] * 8 for _ in range(8)]
 
         self.restart_btn = QPushButton("Restart", self)
         self.restart_btn.setGeometry(150, 380, 90, 20)
         self.restart_btn.clicked.connect(self.restart)
 
+        self.engine_btn = QPushButton("Computer", self)
+        self.engine_btn.setGeometry(250, 380, 90, 20)
+        self.engine_btn.setCheckable(True)
+        self.engine_btn.toggled.connect(self.engine_toggled)
+
         self.load_images()
         self.initUI()
         self.draw()
 
     def closeEvent(self, e) -> None:
+        self.stop_engine()
+        self.flush_timer.stop()
+        # Writes pending moves
         self.db.close()
+        if self.book is not None:
+            self.book.close()
+        for tablebase in (self.tablebase, self.engine_tablebase):
+            if tablebase is not None:
+                tablebase.close()
         super().closeEvent(e)
 
     def initUI(self) -> None:
@@ -51,8 +133,6 @@ class ChessWindow(QMainWindow):
             for x in range(8):
                 btn = QPushButton(self)
                 btn.setGeometry(x * 45 + 15, y * 45 + 15, 45, 45)
-                id = self.board.cell(y, x)
-                btn.setIcon(QIcon(self.icons[id.lower()]))
                 btn.setIconSize(QPixmap(45, 45).size())
                 btn.clicked.connect(self.onclick)
                 btn.setObjectName(f"{y}:{x}")
@@ -66,16 +146,18 @@ class ChessWindow(QMainWindow):
             self.icons[char] = QPixmap(f"{DIRNAME}/icons/{char.lower()}.png")
         self.icons["  "] = QPixmap(45, 45)
         self.icons["  "].fill(QColorConstants.Transparent)
+        # Buttons share these instead of making an icon per repaint
+        self.button_icons = {code: QIcon(pixmap) for code, pixmap in self.icons.items()}
 
     def onclick(self) -> None:
         sender = self.sender()
-        if not sender:
+        if not sender or self.engine_thread is not None:
             return
         coords = tuple(map(int, sender.objectName().split(":")))
         if not self.select:
             if not self.board.get_piece(*coords):
                 return
-            self.select = coords
+            self.select_cell(coords)
         else:
             piece = self.board.get_piece(*self.select)
             if not piece:
@@ -90,9 +172,97 @@ class ChessWindow(QMainWindow):
 
             if res:
                 self.update_session()
-            self.select = None
+                self.schedule_engine_move()
+            self.select_cell(None)
+        self.draw()
+        self.check_game_over()
+
+    def select_cell(self, coords: tuple[int, int] | None) -> None:
+        """Select cell or clear selection, finding legal moves of its piece once"""
+        self.select = coords
+        self.targets = {}
+        if coords is None:
+            return
+        self.targets[coords] = "select"
+        for move in self.board.moves_from(*coords):
+            target = row_col(move.to_sq)
+            if target in self.targets:
+                # Promotions: one move per piece to the same cell
+                continue
+            if move.flags & CASTLE:
+                self.targets[target] = "castle"
+            elif move.flags & CAPTURE:
+                self.targets[target] = "attack"
+            else:
+                self.targets[target] = "move"
+
+    def schedule_engine_move(self) -> None:
+        """Let the computer move after the board is repainted"""
+        if not self.engine_btn.isChecked():
+            return
+        if self.board.current_player_color() != ENGINE_COLOR:
+            return
+        QTimer.singleShot(0, self.engine_move)
+
+    def engine_toggled(self, checked: bool) -> None:
+        if checked:
+            self.schedule_engine_move()
+        else:
+            self.stop_engine()
+
+    def engine_move(self) -> None:
+        """Start searching a copy of the board, the window stays responsive"""
+        if self.board.get_mate() or self.engine_thread is not None:
+            return
+        if self.board.current_player_color() != ENGINE_COLOR:
+            return
+        self.engine_stop = Event()
+        self.engine_thread = QThread(self)
+        board = self.board.copy()
+        # The search probes `engine_tablebase`, never the tables of the window
+        board.tablebase = None
+        self.engine_worker = EngineWorker(
+            board,
+            self.book,
+            self.engine_tablebase,
+            self.engine_stop,
+            self.generation,
+        )
+        self.engine_worker.moveToThread(self.engine_thread)
+        self.engine_thread.started.connect(self.engine_worker.run)
+        # Queued back to the GUI thread, where the board is changed
+        self.engine_worker.done.connect(self.apply_engine_move)
+        self.engine_thread.start()
+
+    def apply_engine_move(self, move: Move | None, generation: int) -> None:
+        if generation != self.generation:
+            # Search stopped by a new game or by closing the window
+            return
+        self.finish_engine()
+        if move is not None and self.board.play_move(move):
+            self.update_session()
+            self.select_cell(None)
         self.draw()
+        self.check_game_over()
+
+    def stop_engine(self) -> None:
+        """Stop running search and drop its move"""
+        self.generation += 1
+        self.engine_stop.set()
+        self.finish_engine()
 
+    def finish_engine(self) -> None:
+        """Wait for the search thread to end"""
+        if self.engine_thread is None:
+            return
+        self.engine_thread.quit()
+        self.engine_thread.wait()
+        self.engine_thread.deleteLater()
+        self.engine_worker.deleteLater()
+        self.engine_thread = None
+        self.engine_worker = None
+
+    def check_game_over(self) -> None:
         if color := self.board.get_mate():
             friendly_color = str(color)
             color_char = repr(color)
@@ -103,7 +273,7 @@ class ChessWindow(QMainWindow):
             msg.setWindowTitle("Results")
             msg.exec()
 
-            self.db.write_leaderboard(color_char)
+            self.db.set_result("1-0" if color == Color.WHITE else "0-1")
             self.db.clear_session()
 
             self.close()
@@ -113,34 +283,32 @@ class ChessWindow(QMainWindow):
 
         turn = str(self.board.current_player_color())
         self.label.setText(f"Turn of {turn}")
+        endgame = self.board.get_endgame()
+        if endgame is None:
+            self.label.setToolTip("")
+        elif endgame[0]:
+            winner = turn if endgame[0] > 0 else str(self.board.color.opponent())
+            self.label.setToolTip(f"{winner} mates in {(endgame[1] + 1) // 2}")
+        else:
+            self.label.setToolTip("Draw")
 
+        # Only cells whose piece or highlight changed are repainted
         for y in range(8):
             for x in range(8):
-                type = (y + x) % 2
-                bg = ("#b16040", "#ebdbb2")[type]
-                if self.select:
-                    yf, xf = self.select
-                    if self.select == (y, x):
-                        bg = "#00cc00"
-                    elif self.board.can_castle(yf, xf, y, x):
-                        bg = "#ffcc00"
-                    elif self.board.can_attack(yf, xf, y, x):
-                        bg = ["#aa0000", "#ff0000"][type]
-                    elif self.board.can_move(yf, xf, y, x):
-                        bg = ["#00aaaa", "#00ffff"][type]
+                style = STYLESHEETS[self.targets.get((y, x)), (y + x) % 2]
                 cell = self.board.cell(y, x)
-                icon = self.icons[cell.lower()]
-                self.buttons[y][x].setStyleSheet(
-                    f"background-color: {bg}; border: none;"
-                )
-                self.buttons[y][x].setIcon(QIcon(icon))
-                self.buttons[y][x].update()
+                painted_cell, painted_style = self.painted[y][x]
+                if cell == painted_cell and style == painted_style:
+                    continue
+                button = self.buttons[y][x]
+                if style != painted_style:
+                    button.setStyleSheet(style)
+                if cell != painted_cell:
+                    button.setIcon(self.button_icons[cell.lower()])
+                self.painted[y][x] = (cell, style)
 
     def update_session(self) -> None:
-        field = self.board.field_as_text()
-        color = self.board.current_player_color()
-        turn = repr(color)
-        self.db.add_move(field, turn)
+        self.db.add_move(self.board)
 
     def select_char(self, color: Color) -> str:
         """Creates dialog with selection for Pawn promotion
@@ -152,7 +320,8 @@ class ChessWindow(QMainWindow):
         return dialog.res
 
     def restart(self) -> None:
-        self.board = Board()
+        self.stop_engine()
+        self.board = Board(tablebase=self.tablebase)
         self.db.clear_session()
-        self.db.create_session()
+        self.select_cell(None)
         self.draw()